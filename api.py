@@ -1,22 +1,47 @@
 # api.py
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from datetime import datetime, timezone
 import services
 import models
 import dependencies
+import metrics
+from jobs import AnalysisJobQueue, QueueFullError
+from config import settings
+from llm_router import ModelRouter
+from rate_limit import limiter, limiter_stats as rate_limit_stats
+from scraper_client import ScraperClient
+from sessions import ChatSession, SessionStore
 
 router = APIRouter()
 
+# /analyze* and /chat* routes each share one per-client bucket; other routes get RATE_LIMIT_DEFAULT
+analyze_limit = limiter.shared_limit(settings.RATE_LIMIT_ANALYZE, scope="analyze")
+chat_limit = limiter.shared_limit(settings.RATE_LIMIT_CHAT, scope="chat")
+
 @router.post("/analyze", response_model=models.AnalysisResponse)
+@analyze_limit
 async def analyze_website(
-    request: models.AnalysisRequest,
-    api_key: str = Depends(dependencies.get_api_key)
+    request: Request,
+    analysis_request: models.AnalysisRequest,
+    api_key: str = Depends(dependencies.get_api_key),
+    client: str = Depends(dependencies.enforce_token_quota),
+    scraper: ScraperClient = Depends(dependencies.get_scraper_client),
+    llm: ModelRouter = Depends(dependencies.get_llm_client),
+    use_cache: bool = Depends(dependencies.cache_allowed)
 ):
     """
     Initiates web scraping and AI-driven analysis of a given website homepage.
+    Set `crawl_depth` to also crawl linked about/contact/pricing/careers pages.
+    Set `quality` to `high` to skip the fast model tier.
+    Send `Cache-Control: no-cache` to bypass cached analyses.
     """
     # services.get_website_analysis now returns a models.AnalysisResponse object
-    analysis_data = await services.get_website_analysis(str(request.url), request.questions)
+    analysis_data = await services.get_website_analysis(
+        str(analysis_request.url), analysis_request.questions, scraper, llm,
+        use_cache=use_cache, crawl_depth=analysis_request.crawl_depth,
+        high_quality=analysis_request.quality == "high"
+    )
 
     # Access attributes directly from the Pydantic model
     return models.AnalysisResponse(
@@ -24,21 +49,235 @@ async def analyze_website(
         extracted_answers=analysis_data.extracted_answers
     )
 
+@router.post("/analyze/batch", response_model=models.BatchAnalysisResponse)
+@analyze_limit
+async def analyze_websites_batch(
+    request: Request,
+    batch_request: models.BatchAnalysisRequest,
+    api_key: str = Depends(dependencies.get_api_key),
+    client: str = Depends(dependencies.enforce_token_quota),
+    scraper: ScraperClient = Depends(dependencies.get_scraper_client),
+    llm: ModelRouter = Depends(dependencies.get_llm_client),
+    use_cache: bool = Depends(dependencies.cache_allowed)
+):
+    """
+    Analyzes many websites in one call. Duplicate URLs are scraped once and
+    each item reports its own result or error.
+    """
+    return await services.get_batch_analysis(batch_request.items, scraper, llm, use_cache=use_cache)
+
+@router.post("/analyze/jobs", response_model=models.AnalysisJob, status_code=status.HTTP_202_ACCEPTED)
+@analyze_limit
+async def submit_analysis_job(
+    request: Request,
+    analysis_request: models.AnalysisRequest,
+    api_key: str = Depends(dependencies.get_api_key),
+    client: str = Depends(dependencies.enforce_token_quota),
+    job_queue: AnalysisJobQueue = Depends(dependencies.get_job_queue),
+    use_cache: bool = Depends(dependencies.cache_allowed)
+):
+    """
+    Queues a website analysis and returns a job id immediately.
+    Poll GET /analyze/jobs/{job_id} for the status and result.
+    """
+    try:
+        return await job_queue.submit(analysis_request, use_cache=use_cache)
+    except QueueFullError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+
+@router.get("/analyze/jobs/{job_id}", response_model=models.AnalysisJob)
+async def get_analysis_job(
+    job_id: str,
+    api_key: str = Depends(dependencies.get_api_key),
+    job_queue: AnalysisJobQueue = Depends(dependencies.get_job_queue)
+):
+    """
+    Returns the status of an analysis job and, once finished, its result.
+    """
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Job not found: {job_id}")
+    return job
+
 @router.post("/chat", response_model=models.ChatResponse)
+@chat_limit
 async def conversational_chat(
-    request: models.ChatRequest,
-    api_key: str = Depends(dependencies.get_api_key)
+    request: Request,
+    chat_request: models.ChatRequest,
+    api_key: str = Depends(dependencies.get_api_key),
+    client: str = Depends(dependencies.enforce_token_quota),
+    scraper: ScraperClient = Depends(dependencies.get_scraper_client),
+    llm: ModelRouter = Depends(dependencies.get_llm_client)
 ):
     """
     Enables conversational follow-up questions about a previously analyzed website.
     """
     agent_response = await services.get_conversational_answer(
-        url=str(request.url),
-        query=request.query,
-        history=request.conversation_history
+        url=str(chat_request.url),
+        query=chat_request.query,
+        history=chat_request.conversation_history,
+        scraper=scraper,
+        llm=llm,
+        high_quality=chat_request.quality == "high"
     )
     
     return models.ChatResponse(
         agent_response=agent_response.get("agent_response"),
         context_sources=agent_response.get("context_sources", [])
     )
+
+
+@router.post("/chat/stream", response_class=StreamingResponse)
+@chat_limit
+async def conversational_chat_stream(
+    request: Request,
+    chat_request: models.ChatRequest,
+    api_key: str = Depends(dependencies.get_api_key),
+    client: str = Depends(dependencies.enforce_token_quota),
+    scraper: ScraperClient = Depends(dependencies.get_scraper_client),
+    llm: ModelRouter = Depends(dependencies.get_llm_client)
+):
+    """
+    Streaming variant of /chat. Returns Server-Sent Events: `token` events with
+    answer text as it is generated, then a final `result` event with the ChatResponse.
+    """
+    # Scrape before the stream opens so scraping errors still surface as HTTP status codes
+    prompt, passages = await services.build_conversational_prompt(
+        url=str(chat_request.url),
+        query=chat_request.query,
+        history=chat_request.conversation_history,
+        scraper=scraper
+    )
+    return StreamingResponse(
+        services.stream_conversational_answer(prompt, passages, llm, chat_request.quality == "high"),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/chat/sessions", response_model=models.ChatSessionInfo, status_code=status.HTTP_201_CREATED)
+@chat_limit
+async def create_chat_session(
+    request: Request,
+    session_request: models.ChatSessionCreateRequest,
+    api_key: str = Depends(dependencies.get_api_key),
+    scraper: ScraperClient = Depends(dependencies.get_scraper_client),
+    store: SessionStore = Depends(dependencies.get_session_store)
+):
+    """
+    Starts a server-side conversation about a website. The site is scraped once
+    and later turns only send the new query.
+    """
+    session = await services.create_chat_session(str(session_request.url), store, scraper)
+    return session.info()
+
+def _get_session_or_404(session_id: str, store: SessionStore) -> ChatSession:
+    session = store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Chat session not found: {session_id}")
+    return session
+
+@router.get("/chat/sessions/{session_id}", response_model=models.ChatSessionInfo)
+async def get_chat_session(
+    session_id: str,
+    api_key: str = Depends(dependencies.get_api_key),
+    store: SessionStore = Depends(dependencies.get_session_store)
+):
+    """
+    Returns metadata about a chat session.
+    """
+    return _get_session_or_404(session_id, store).info()
+
+@router.post("/chat/sessions/{session_id}/messages", response_model=models.ChatResponse)
+@chat_limit
+async def chat_session_message(
+    request: Request,
+    session_id: str,
+    message_request: models.ChatSessionMessageRequest,
+    api_key: str = Depends(dependencies.get_api_key),
+    client: str = Depends(dependencies.enforce_token_quota),
+    store: SessionStore = Depends(dependencies.get_session_store),
+    llm: ModelRouter = Depends(dependencies.get_llm_client)
+):
+    """
+    Answers the next query in a chat session using the server-side history.
+    """
+    session = _get_session_or_404(session_id, store)
+    agent_response = await services.get_session_answer(
+        session, message_request.query, store, llm, high_quality=message_request.quality == "high"
+    )
+    return models.ChatResponse(
+        agent_response=agent_response.get("agent_response"),
+        context_sources=agent_response.get("context_sources", [])
+    )
+
+@router.delete("/chat/sessions/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_chat_session(
+    session_id: str,
+    api_key: str = Depends(dependencies.get_api_key),
+    store: SessionStore = Depends(dependencies.get_session_store)
+):
+    """
+    Ends a chat session and frees its server-side history.
+    """
+    if not store.delete(session_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Chat session not found: {session_id}")
+
+@router.get("/stats")
+async def service_stats(
+    api_key: str = Depends(dependencies.get_api_key),
+    scraper: ScraperClient = Depends(dependencies.get_scraper_client),
+    llm: ModelRouter = Depends(dependencies.get_llm_client),
+    job_queue: AnalysisJobQueue = Depends(dependencies.get_job_queue),
+    store: SessionStore = Depends(dependencies.get_session_store)
+):
+    """
+    Returns runtime statistics for sizing the service's shared resources.
+    """
+    return {
+        "scraper_pool": scraper.stats(),
+        "parse_pool": services.parse_pool.stats(),
+        "llm": llm.stats(),
+        "scrape_cache": await services.scrape_cache.stats(),
+        "analysis_cache": await services.analysis_cache.stats(),
+        "robots": services.robots_cache.stats(),
+        "retrieval": services.retrieval_indexes.stats(),
+        "rate_limit": rate_limit_stats(),
+        "singleflight": {
+            "scrape": services.scrape_flights.stats(),
+            "analysis": services.analysis_flights.stats()
+        },
+        "jobs": job_queue.stats(),
+        "chat_sessions": store.stats()
+    }
+
+@router.get("/metrics", response_class=PlainTextResponse)
+@limiter.exempt
+async def prometheus_metrics(
+    api_key: str = Depends(dependencies.get_api_key)
+):
+    """
+    Exposes request, stage latency and upstream metrics in the Prometheus text format.
+    Configure the scraper with the API key as its bearer token. Values are per worker.
+    """
+    return PlainTextResponse(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+@router.get("/healthz", tags=["Probes"])
+@limiter.exempt
+async def liveness(request: Request):
+    """
+    Liveness probe: the worker is up and serving. Unauthenticated and not rate limited.
+    """
+    return {"status": "ok"}
+
+@router.get("/readyz", tags=["Probes"])
+@limiter.exempt
+async def readiness(request: Request):
+    """
+    Readiness probe: 200 once the worker's warm-up (Gemini SDK import and model
+    construction) has finished, 503 until then. Route traffic only to ready workers.
+    """
+    state = request.app.state
+    if state.warm_up_seconds is None:
+        detail = f"Warm-up failed: {state.warm_up_error}" if state.warm_up_error else "Warming up"
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=detail)
+    return {"status": "ready", "warm_up_seconds": round(state.warm_up_seconds, 3)}
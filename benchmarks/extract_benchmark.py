@@ -0,0 +1,76 @@
+"""
+Compares the HTML text extractors on saved homepage fixtures.
+
+For every fixture it reports documents/second and MB/second for the
+BeautifulSoup and single-pass streaming engines at the production text
+budget, and checks output parity. The BeautifulSoup path de-duplicates
+with a set (so its line order is arbitrary), therefore parity compares the
+unbounded outputs as sets of lines.
+
+Usage:
+    python benchmarks/extract_benchmark.py [--seconds 1.0] [--heavy-repeat 500]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Make the application modules importable when run from anywhere
+BENCHMARK_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARK_DIR.parent))
+
+from extractors import TEXT_CONTENT_LIMIT, extract_text_bs4, extract_text_stream  # noqa: E402
+
+FIXTURES_DIR = BENCHMARK_DIR / "fixtures"
+
+
+def load_fixtures(heavy_repeat: int) -> dict:
+    fixtures = {path.stem: path.read_text(encoding="utf-8") for path in sorted(FIXTURES_DIR.glob("*.html"))}
+    if heavy_repeat and "saas_landing" in fixtures:
+        # Simulate a multi-megabyte marketing page by repeating the landing page body
+        page = fixtures["saas_landing"]
+        head, _, rest = page.partition("<body>")
+        body, _, tail = rest.partition("</body>")
+        sections = "".join(body.replace("<h2>", f"<h2>Part {i}: ") for i in range(heavy_repeat))
+        fixtures["heavy_marketing"] = f"{head}<body>{sections}</body>{tail}"
+    return fixtures
+
+
+def throughput(extract, html: str, seconds: float) -> float:
+    """Runs extract repeatedly for roughly `seconds` and returns documents per second."""
+    runs = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while True:
+        extract(html, TEXT_CONTENT_LIMIT)
+        runs += 1
+        now = time.perf_counter()
+        if now >= deadline:
+            return runs / (now - start)
+
+
+def parity(html: str) -> bool:
+    bs4_lines = set(extract_text_bs4(html, None).split("\n"))
+    stream_lines = set(extract_text_stream(html, None).split("\n"))
+    return bs4_lines == stream_lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=1.0, help="time budget per engine and fixture")
+    parser.add_argument("--heavy-repeat", type=int, default=500, help="size multiplier for the synthetic heavy page (0 disables)")
+    args = parser.parse_args()
+
+    print(f"{'fixture':<18}{'size KB':>9}{'bs4 doc/s':>12}{'stream doc/s':>14}{'speedup':>9}{'stream MB/s':>13}  parity")
+    for name, html in load_fixtures(args.heavy_repeat).items():
+        size_mb = len(html.encode("utf-8")) / 1_000_000
+        bs4_rate = throughput(extract_text_bs4, html, args.seconds)
+        stream_rate = throughput(extract_text_stream, html, args.seconds)
+        print(
+            f"{name:<18}{size_mb * 1000:>9.1f}{bs4_rate:>12.1f}{stream_rate:>14.1f}"
+            f"{stream_rate / bs4_rate:>8.1f}x{stream_rate * size_mb:>13.2f}  {'ok' if parity(html) else 'MISMATCH'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
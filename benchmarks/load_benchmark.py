@@ -0,0 +1,404 @@
+"""
+Offline load test for the API.
+
+Runs the FastAPI app in-process (lifespan included) behind an ASGI transport,
+scraping a local website stand-in that serves the HTML fixtures and answering
+with a fake Gemini model of configurable latency and error rate, so no network
+access or API key is needed. Each scenario (/analyze, /analyze/batch, /chat,
+/chat/stream) is driven at every requested concurrency and reports req/s,
+p50/p95/p99 latency, status codes, memory and the average time per pipeline
+stage (from the /metrics histograms).
+
+By default every request scrapes a distinct URL and bypasses the caches, so the
+whole pipeline is measured; --warm reuses URLs and lets the caches answer.
+Rate limits and the token quota are switched off for the run. Set
+LLM_STRUCTURED_OUTPUT=true to measure the structured-output prompts.
+
+Results are written as JSON. Pass --baseline with an earlier result file to
+compare: the run fails when a scenario's p95 latency regresses, or its req/s
+drops, by more than --tolerance.
+
+Usage:
+    python benchmarks/load_benchmark.py [--scenarios analyze,chat] [--concurrency 1,8,32]
+        [--requests 200] [--llm-latency 0.2] [--llm-error-rate 0.0] [--site-latency 0.0]
+        [--warm] [--output results.json] [--baseline previous.json]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+from typing import List, Optional
+
+# Make the application modules importable when run from anywhere
+BENCHMARK_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARK_DIR.parent))
+
+# Per-process backends so a run leaves no SQLite files behind (a local .env still takes precedence)
+os.environ.setdefault("GEMINI_API_KEY", "offline-benchmark")  # never sent: Gemini is faked
+os.environ.setdefault("RATE_LIMIT_STORAGE_URI", "memory://")
+os.environ.setdefault("SCRAPE_CACHE_BACKEND", "memory")
+os.environ.setdefault("ANALYSIS_CACHE_BACKEND", "memory")
+os.environ.setdefault("JOB_STORE_BACKEND", "memory")
+
+import httpx  # noqa: E402
+from google.api_core import exceptions as google_exceptions  # noqa: E402
+
+import metrics  # noqa: E402
+from config import settings  # noqa: E402
+from extract_benchmark import load_fixtures  # noqa: E402
+from main import app, lifespan  # noqa: E402
+from rate_limit import limiter, token_quota  # noqa: E402
+
+SCENARIOS = ("analyze", "batch", "chat", "chat_stream")
+STAGES = ("scrape_fetch", "html_parse", "prompt_build", "llm_call", "validation")
+QUESTIONS = ["What is their primary business model?", "Where is the company located?"]
+CHAT_QUERY = "What are their main products or services?"
+
+FAKE_ANALYSIS = json.dumps({
+    "company_info": {
+        "industry": "SaaS",
+        "company_size": None,
+        "location": "Remote",
+        "core_products_services": ["Analytics platform"],
+        "unique_selling_proposition": "Fast, private analytics.",
+        "target_audience": "B2B SaaS companies",
+        "contact_info": {"email": None, "phone": None, "social_media": {"linkedin": None, "twitter": None}},
+    },
+    # One of two answers missing: at the default LLM_ESCALATE_NOT_AVAILABLE_RATIO the fast tier's answer stands
+    "extracted_answers": [
+        {"question": QUESTIONS[0], "answer": "Subscription software"},
+        {"question": QUESTIONS[1], "answer": "Not available"},
+    ],
+})
+FAKE_CHAT = json.dumps({"agent_response": "They sell an analytics platform for B2B teams.", "sources": [1]})
+
+
+# --- LOCAL STAND-INS ---
+
+def start_fake_site(fixtures: dict, latency: float) -> ThreadingHTTPServer:
+    """Serves each fixture at /<name> (any query string) from a background thread."""
+    pages = {f"/{name}": html.encode("utf-8") for name, html in fixtures.items()}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, so the scraper pool is exercised
+
+        def do_GET(self):
+            body = pages.get(self.path.split("?", 1)[0])
+            if latency:
+                time.sleep(latency)
+            self.send_response(200 if body is not None else 404)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body or b"")))
+            self.end_headers()
+            self.wfile.write(body or b"")
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-site", daemon=True).start()
+    return server
+
+
+class _FakeStream:
+    def __init__(self, chunks: list):
+        self._chunks = chunks
+
+    async def __aiter__(self):
+        for chunk in self._chunks:
+            await asyncio.sleep(0)
+            yield chunk
+
+
+class FakeGemini:
+    """
+    Drop-in for GenerativeModel.generate_content_async. Sleeps for latency
+    (+/- jitter), fails with a 429 or 503 at error_rate, and otherwise returns
+    a valid analysis or chat JSON with usage metadata.
+    """
+
+    def __init__(self, latency: float, jitter: float, error_rate: float):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    async def generate_content_async(self, prompt: str, stream: bool = False, generation_config=None, request_options=None):
+        await asyncio.sleep(max(self.latency * random.uniform(1 - self.jitter, 1 + self.jitter), 0.0))
+        if random.random() < self.error_rate:
+            error = random.choice([google_exceptions.TooManyRequests, google_exceptions.ServiceUnavailable])
+            raise error("fake upstream overload")
+
+        text = FAKE_CHAT if "**Website Passages:**" in prompt else FAKE_ANALYSIS
+        usage = SimpleNamespace(
+            prompt_token_count=len(prompt) // 4,
+            candidates_token_count=len(text) // 4,
+            total_token_count=len(prompt) // 4 + len(text) // 4,
+        )
+        if not stream:
+            return SimpleNamespace(text=text, usage_metadata=usage)
+        pieces = [text[i:i + 16] for i in range(0, len(text), 16)]
+        chunks = [SimpleNamespace(text=piece, usage_metadata=None) for piece in pieces]
+        chunks[-1].usage_metadata = usage
+        return _FakeStream(chunks)
+
+
+# --- MEASUREMENT ---
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def rss_mb() -> Optional[float]:
+    """Current resident set size, where /proc is available."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return round(int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1_000_000, 1)
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak / 1_000_000 if sys.platform == "darwin" else peak / 1000
+
+
+def stage_snapshot() -> dict:
+    return {stage: metrics.stage_seconds.labels(stage).snapshot() for stage in STAGES}
+
+
+def stage_averages(before: dict, after: dict) -> dict:
+    averages = {}
+    for stage in STAGES:
+        count = after[stage][0] - before[stage][0]
+        total = after[stage][1] - before[stage][1]
+        averages[stage] = {"count": count, "avg_ms": round(total / count * 1000, 3) if count else None}
+    return averages
+
+
+class Workload:
+    """Builds the request for the i-th call of a scenario."""
+
+    def __init__(self, site_url: str, fixture_names: List[str], batch_size: int, warm: bool):
+        self.site_url = site_url
+        self.fixture_names = fixture_names
+        self.batch_size = batch_size
+        self.warm = warm
+        self.run_id = int(time.time())
+        # Shared by every scenario and concurrency level, so no two cold requests share a URL
+        self._sequence = itertools.count()
+
+    def page_url(self, i: int) -> str:
+        name = self.fixture_names[i % len(self.fixture_names)]
+        if self.warm:
+            return f"{self.site_url}/{name}"
+        # A distinct URL per request keeps the caches and single-flight out of the measurement
+        # (/chat has no Cache-Control bypass, so only a new URL avoids the scrape cache)
+        return f"{self.site_url}/{name}?run={self.run_id}&n={next(self._sequence)}"
+
+    def request(self, scenario: str, i: int) -> tuple:
+        if scenario == "analyze":
+            return "/analyze", {"url": self.page_url(i), "questions": QUESTIONS}
+        if scenario == "batch":
+            items = [
+                {"url": self.page_url(i * self.batch_size + j), "questions": QUESTIONS}
+                for j in range(self.batch_size)
+            ]
+            return "/analyze/batch", {"items": items}
+        path = "/chat/stream" if scenario == "chat_stream" else "/chat"
+        return path, {"url": self.page_url(i), "query": CHAT_QUERY}
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    workload: Workload,
+    scenario: str,
+    concurrency: int,
+    total_requests: int,
+    headers: dict,
+) -> dict:
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < total_requests:
+            i = next_index
+            next_index += 1
+            path, payload = workload.request(scenario, i)
+            started = time.perf_counter()
+            try:
+                async with client.stream("POST", path, json=payload, headers=headers) as response:
+                    await response.aread()
+                    statuses[str(response.status_code)] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - started)
+
+    stages_before = stage_snapshot()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "ok": statuses.get("200", 0),
+        "statuses": dict(statuses),
+        "duration_seconds": round(elapsed, 3),
+        "requests_per_second": round(total_requests / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+            "p50": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99": round(percentile(latencies, 0.99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        },
+        "rss_mb": rss_mb(),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "stages": stage_averages(stages_before, stage_snapshot()),
+    }
+
+
+def compare(results: List[dict], baseline_path: Path, tolerance: float) -> List[str]:
+    """Returns a line per scenario that regressed against the baseline run."""
+    baseline = {
+        (r["scenario"], r["concurrency"]): r
+        for r in json.loads(baseline_path.read_text(encoding="utf-8"))["results"]
+    }
+    regressions = []
+    for result in results:
+        previous = baseline.get((result["scenario"], result["concurrency"]))
+        if previous is None:
+            continue
+        label = f"{result['scenario']} c={result['concurrency']}"
+        p95, previous_p95 = result["latency_ms"]["p95"], previous["latency_ms"]["p95"]
+        if previous_p95 and p95 > previous_p95 * (1 + tolerance):
+            regressions.append(f"{label}: p95 {previous_p95}ms -> {p95}ms")
+        rps, previous_rps = result["requests_per_second"], previous["requests_per_second"]
+        if previous_rps and rps < previous_rps * (1 - tolerance):
+            regressions.append(f"{label}: {previous_rps} req/s -> {rps} req/s")
+    return regressions
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARK_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> List[dict]:
+    fixtures = load_fixtures(args.heavy_repeat)
+    site = start_fake_site(fixtures, args.site_latency)
+    site_url = f"http://127.0.0.1:{site.server_address[1]}"
+    workload = Workload(site_url, list(fixtures), args.batch_size, args.warm)
+    headers = {"Authorization": f"Bearer {settings.API_SECRET_KEY}"}
+    if not args.warm:
+        headers["Cache-Control"] = "no-cache"
+
+    limiter.enabled = False
+    token_quota.enabled = False
+
+    results = []
+    try:
+        async with lifespan(app):
+            # Let the real models finish loading so they cannot replace the fakes afterwards
+            await app.state.warm_up
+            for tier in app.state.llm_client.tiers():
+                tier._model = FakeGemini(args.llm_latency, args.llm_jitter, args.llm_error_rate)
+                tier._use_async_sdk = True
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+                for scenario in args.scenarios:
+                    for concurrency in args.concurrency:
+                        result = await run_scenario(
+                            client, workload, scenario, concurrency, args.requests, headers
+                        )
+                        results.append(result)
+                        latency = result["latency_ms"]
+                        print(
+                            f"{scenario:<12}{concurrency:>6}{result['requests_per_second']:>10.1f}"
+                            f"{latency['p50']:>10.1f}{latency['p95']:>10.1f}{latency['p99']:>10.1f}"
+                            f"{result['ok']:>6}/{result['requests']:<6}{result['peak_rss_mb']:>9.1f}"
+                        )
+    finally:
+        site.shutdown()
+    return results
+
+
+def parse_list(value: str, cast=str) -> list:
+    return [cast(item) for item in value.split(",") if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", type=lambda v: parse_list(v), default=list(SCENARIOS),
+                        help=f"comma-separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=lambda v: parse_list(v, int), default=[1, 8, 32],
+                        help="comma-separated client concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario and concurrency level")
+    parser.add_argument("--batch-size", type=int, default=5, help="URLs per /analyze/batch request")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="fake Gemini latency in seconds")
+    parser.add_argument("--llm-jitter", type=float, default=0.25, help="relative +/- jitter on the fake latency")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="fraction of fake Gemini calls failing with 429/503")
+    parser.add_argument("--site-latency", type=float, default=0.0, help="fake website latency in seconds")
+    parser.add_argument("--heavy-repeat", type=int, default=50, help="size multiplier for the synthetic heavy page (0 disables)")
+    parser.add_argument("--warm", action="store_true", help="reuse URLs and allow cached scrapes and analyses")
+    parser.add_argument("--output", type=Path, help="result file (default: benchmarks/results/load-<timestamp>.json)")
+    parser.add_argument("--baseline", type=Path, help="earlier result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression against the baseline")
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    print(f"{'scenario':<12}{'conc':>6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ok':>7}{'':<6}{'peak MB':>9}")
+    results = asyncio.run(run(args))
+
+    started_at = datetime.now(timezone.utc)
+    output = args.output or BENCHMARK_DIR / "results" / f"load-{started_at:%Y%m%dT%H%M%SZ}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    config = {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()}
+    output.write_text(json.dumps({
+        "created_at": started_at.isoformat(),
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "config": config,
+        "results": results,
+    }, indent=2), encoding="utf-8")
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
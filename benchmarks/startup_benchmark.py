@@ -0,0 +1,172 @@
+"""
+Measures worker cold start.
+
+Each run starts a fresh interpreter that imports the app (`import main`, what
+uvicorn does), runs the lifespan startup (the point where the worker can
+serve /healthz) and waits for the warm-up task (the point where /readyz turns
+ready). It also lists which heavy SDKs the import alone loaded, so a module
+that starts importing one eagerly again shows up. No network access or API
+key is needed: the Gemini SDK is configured but never called.
+
+Results are written as JSON. Pass --baseline with an earlier result file to
+compare: the run fails when the median import or time-to-ready regresses by
+more than --tolerance.
+
+Usage:
+    python benchmarks/startup_benchmark.py [--runs 5] [--output results.json] [--baseline previous.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+
+# Make the application modules importable when run from anywhere
+BENCHMARK_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARK_DIR.parent))
+
+# Modules that should only load during warm-up or on first use, never on import
+HEAVY_MODULES = ("google.generativeai", "google.api_core.exceptions", "grpc", "bs4", "IPython")
+PHASES = ("import_seconds", "live_seconds", "ready_seconds", "process_seconds")
+
+# Per-process backends so a run leaves no SQLite files behind (a local .env still takes precedence)
+CHILD_ENV = {
+    "GEMINI_API_KEY": "offline-benchmark",  # never sent: no Gemini call is made
+    "RATE_LIMIT_STORAGE_URI": "memory://",
+    "SCRAPE_CACHE_BACKEND": "memory",
+    "ANALYSIS_CACHE_BACKEND": "memory",
+    "JOB_STORE_BACKEND": "memory",
+}
+
+
+def measure_child() -> dict:
+    """Runs in the fresh interpreter: times the import, startup and warm-up of the app."""
+    started = time.perf_counter()
+    from main import app, lifespan
+    imported = time.perf_counter()
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    async def start() -> tuple:
+        async with lifespan(app):
+            live = time.perf_counter()
+            await app.state.warm_up
+            return live, time.perf_counter(), app.state.warm_up_error
+
+    live, ready, error = asyncio.run(start())
+    return {
+        "import_seconds": imported - started,
+        "live_seconds": live - started,
+        "ready_seconds": ready - started,
+        "heavy_modules_on_import": loaded,
+        "warm_up_error": error,
+    }
+
+
+def run_once() -> dict:
+    env = {**CHILD_ENV, **os.environ}
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, str(Path(__file__).resolve()), "--child"],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    elapsed = time.perf_counter() - started
+    # The app prints DEBUG lines; the measurement is the last line
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["process_seconds"] = elapsed
+    return result
+
+
+def summarize(runs: List[dict]) -> dict:
+    summary = {}
+    for phase in PHASES:
+        values = [run[phase] for run in runs]
+        summary[phase] = {
+            "median": round(statistics.median(values), 4),
+            "min": round(min(values), 4),
+            "max": round(max(values), 4),
+        }
+    summary["heavy_modules_on_import"] = sorted({name for run in runs for name in run["heavy_modules_on_import"]})
+    summary["warm_up_errors"] = sorted({run["warm_up_error"] for run in runs if run["warm_up_error"]})
+    return summary
+
+
+def compare(summary: dict, baseline_path: Path, tolerance: float) -> List[str]:
+    """Returns a line per phase that regressed against the baseline run."""
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))["summary"]
+    regressions = []
+    for phase in ("import_seconds", "ready_seconds"):
+        median, previous = summary[phase]["median"], baseline.get(phase, {}).get("median")
+        if previous and median > previous * (1 + tolerance):
+            regressions.append(f"{phase}: median {previous}s -> {median}s")
+    return regressions
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARK_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to start")
+    parser.add_argument("--output", type=Path, help="result file (default: benchmarks/results/startup-<timestamp>.json)")
+    parser.add_argument("--baseline", type=Path, help="earlier result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression against the baseline")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure_child()))
+        return
+
+    print(f"{'run':<6}{'import s':>10}{'live s':>10}{'ready s':>10}{'process s':>11}  heavy modules on import")
+    runs = []
+    for i in range(args.runs):
+        run = run_once()
+        runs.append(run)
+        print(
+            f"{i + 1:<6}{run['import_seconds']:>10.3f}{run['live_seconds']:>10.3f}"
+            f"{run['ready_seconds']:>10.3f}{run['process_seconds']:>11.3f}  {', '.join(run['heavy_modules_on_import']) or '-'}"
+        )
+    summary = summarize(runs)
+    print(
+        f"median: import {summary['import_seconds']['median']:.3f}s, live {summary['live_seconds']['median']:.3f}s, "
+        f"ready {summary['ready_seconds']['median']:.3f}s"
+    )
+    for error in summary["warm_up_errors"]:
+        print(f"WARM-UP ERROR {error}")
+
+    started_at = datetime.now(timezone.utc)
+    output = args.output or BENCHMARK_DIR / "results" / f"startup-{started_at:%Y%m%dT%H%M%SZ}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    config = {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items() if key != "child"}
+    output.write_text(json.dumps({
+        "created_at": started_at.isoformat(),
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "config": config,
+        "summary": summary,
+        "runs": runs,
+    }, indent=2), encoding="utf-8")
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        regressions = compare(summary, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import models
+from metrics import cache_requests
+
+
+@dataclass
+class CacheEntry:
+    value: str
+    stored_at: float
+
+
+# --- BACKENDS ---
+# Backends store opaque string values with an LRU bound. Freshness (TTL) is
+# decided by the typed caches built on top of them, so stale entries can still
+# be used for conditional revalidation until they age out or are evicted.
+
+class CacheBackend(ABC):
+    """Key/value storage interface shared by the application caches."""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: str, stored_at: Optional[float] = None) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    async def clear(self) -> None:
+        ...
+
+    @abstractmethod
+    async def size(self) -> int:
+        ...
+
+    async def aclose(self) -> None:
+        pass
+
+
+class InMemoryCacheBackend(CacheBackend):
+    """Per-process LRU cache. Entries older than max_age are dropped on read."""
+
+    def __init__(self, max_entries: int = 1024, max_age: Optional[float] = None):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self.max_age is not None and time.time() - entry.stored_at > self.max_age:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    async def set(self, key: str, value: str, stored_at: Optional[float] = None) -> None:
+        self._entries[key] = CacheEntry(value=value, stored_at=stored_at or time.time())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    async def clear(self) -> None:
+        self._entries.clear()
+
+    async def size(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    SQLite-backed LRU cache that survives restarts and is shared by every
+    uvicorn worker pointing at the same file. Several caches can share one
+    database file through distinct namespaces.
+    """
+
+    def __init__(self, path: str, namespace: str, max_entries: int = 10000, max_age: Optional[float] = None):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+            " stored_at REAL NOT NULL, accessed_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_lru ON cache (namespace, accessed_at)")
+        self._conn.commit()
+
+    def _run(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+            self._conn.commit()
+            return rows
+
+    def _get(self, key: str) -> Optional[CacheEntry]:
+        rows = self._run(
+            "SELECT value, stored_at FROM cache WHERE namespace = ? AND key = ?",
+            (self.namespace, key),
+        )
+        if not rows:
+            return None
+        value, stored_at = rows[0]
+        if self.max_age is not None and time.time() - stored_at > self.max_age:
+            self._run("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+            return None
+        self._run(
+            "UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?",
+            (time.time(), self.namespace, key),
+        )
+        return CacheEntry(value=value, stored_at=stored_at)
+
+    def _set(self, key: str, value: str, stored_at: float) -> None:
+        self._run(
+            "INSERT OR REPLACE INTO cache (namespace, key, value, stored_at, accessed_at)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (self.namespace, key, value, stored_at, time.time()),
+        )
+        # Evict least recently used rows beyond the bound
+        self._run(
+            "DELETE FROM cache WHERE namespace = ? AND key IN ("
+            " SELECT key FROM cache WHERE namespace = ?"
+            " ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.max_entries),
+        )
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: str, stored_at: Optional[float] = None) -> None:
+        await asyncio.to_thread(self._set, key, value, stored_at or time.time())
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(
+            self._run, "DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key)
+        )
+
+    async def clear(self) -> None:
+        await asyncio.to_thread(self._run, "DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+
+    async def size(self) -> int:
+        rows = await asyncio.to_thread(
+            self._run, "SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)
+        )
+        return rows[0][0]
+
+    async def aclose(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def create_cache_backend(
+    backend: str,
+    namespace: str,
+    max_entries: int,
+    max_age: Optional[float] = None,
+    sqlite_path: str = "cache.sqlite3",
+) -> CacheBackend:
+    """Builds the configured cache backend ('memory' or 'sqlite')."""
+    if backend == "memory":
+        return InMemoryCacheBackend(max_entries=max_entries, max_age=max_age)
+    if backend == "sqlite":
+        return SQLiteCacheBackend(sqlite_path, namespace, max_entries=max_entries, max_age=max_age)
+    raise ValueError(f"Unknown cache backend: {backend!r}")
+
+
+# --- SCRAPE CACHE ---
+
+_SCRAPE_HIT = cache_requests.labels("scrape", "hit")
+_SCRAPE_MISS = cache_requests.labels("scrape", "miss")
+_SCRAPE_STALE = cache_requests.labels("scrape", "stale")
+
+def normalize_url(url: str) -> str:
+    """Normalizes a URL so equivalent spellings share one cache entry."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    path = parts.path or "/"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+@dataclass
+class ScrapedPage:
+    text: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    # Absolute hrefs found on the page; only collected for crawls
+    links: List[str] = field(default_factory=list)
+
+
+class ScrapeCache:
+    """
+    Caches extracted page text by normalized URL.
+
+    Entries are served directly while younger than the TTL. Once stale they are
+    kept so the scraper can revalidate them with If-None-Match/If-Modified-Since
+    and reuse the stored text on a 304 instead of re-downloading and re-parsing.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.revalidated = 0
+
+    @classmethod
+    def from_settings(cls, settings) -> "ScrapeCache":
+        backend = create_cache_backend(
+            settings.SCRAPE_CACHE_BACKEND,
+            namespace="scrape",
+            max_entries=settings.SCRAPE_CACHE_MAX_ENTRIES,
+            max_age=settings.SCRAPE_CACHE_TTL_SECONDS + settings.SCRAPE_CACHE_STALE_SECONDS,
+            sqlite_path=settings.CACHE_SQLITE_PATH,
+        )
+        return cls(backend, ttl=settings.SCRAPE_CACHE_TTL_SECONDS)
+
+    async def lookup(self, key: str, allow_fresh: bool = True) -> Tuple[Optional[ScrapedPage], bool]:
+        """
+        Returns (page, is_fresh). page is None on a miss. With allow_fresh=False
+        every entry is reported stale so the caller revalidates with the origin.
+        """
+        entry = await self.backend.get(key)
+        if entry is None:
+            self.misses += 1
+            _SCRAPE_MISS.inc()
+            return None, False
+        page = ScrapedPage(**json.loads(entry.value))
+        if allow_fresh and time.time() - entry.stored_at <= self.ttl:
+            self.hits += 1
+            _SCRAPE_HIT.inc()
+            return page, True
+        self.stale += 1
+        _SCRAPE_STALE.inc()
+        return page, False
+
+    async def store(self, key: str, page: ScrapedPage) -> None:
+        await self.backend.set(key, json.dumps(asdict(page)))
+
+    async def mark_revalidated(self, key: str, page: ScrapedPage) -> None:
+        """Restarts the TTL of a stale entry after the origin answered 304."""
+        self.revalidated += 1
+        await self.store(key, page)
+
+    @staticmethod
+    def conditional_headers(page: ScrapedPage) -> dict:
+        headers = {}
+        if page.etag:
+            headers["If-None-Match"] = page.etag
+        if page.last_modified:
+            headers["If-Modified-Since"] = page.last_modified
+        return headers
+
+    async def stats(self) -> dict:
+        return {
+            "entries": await self.backend.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "revalidated": self.revalidated,
+        }
+
+
+# --- ANALYSIS RESPONSE CACHE ---
+
+_ANALYSIS_HIT = cache_requests.labels("analysis", "hit")
+_ANALYSIS_MISS = cache_requests.labels("analysis", "miss")
+_ANALYSIS_BYPASS = cache_requests.labels("analysis", "bypass")
+
+def normalize_questions(questions: List[str]) -> List[str]:
+    """Collapses insignificant whitespace so trivially different question lists share a key."""
+    return [" ".join(q.split()) for q in questions if q and q.strip()]
+
+
+class AnalysisCache:
+    """
+    Caches validated AnalysisResponse objects.
+
+    The key covers everything that determines the LLM output: model name,
+    prompt template version, a hash of the scraped text and the normalized
+    question list. Identical analyses within the TTL skip the Gemini call.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    @classmethod
+    def from_settings(cls, settings) -> "AnalysisCache":
+        backend = create_cache_backend(
+            settings.ANALYSIS_CACHE_BACKEND,
+            namespace="analysis",
+            max_entries=settings.ANALYSIS_CACHE_MAX_ENTRIES,
+            max_age=settings.ANALYSIS_CACHE_TTL_SECONDS,
+            sqlite_path=settings.CACHE_SQLITE_PATH,
+        )
+        return cls(backend, ttl=settings.ANALYSIS_CACHE_TTL_SECONDS)
+
+    @staticmethod
+    def make_key(model_name: str, prompt_version: str, text_content: str, questions: List[str]) -> str:
+        content_hash = hashlib.sha256(text_content.encode("utf-8")).hexdigest()
+        material = json.dumps([model_name, prompt_version, content_hash, normalize_questions(questions)])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[models.AnalysisResponse]:
+        entry = await self.backend.get(key)
+        if entry is None or time.time() - entry.stored_at > self.ttl:
+            self.misses += 1
+            _ANALYSIS_MISS.inc()
+            return None
+        self.hits += 1
+        _ANALYSIS_HIT.inc()
+        return models.AnalysisResponse.model_validate_json(entry.value)
+
+    async def set(self, key: str, response: models.AnalysisResponse) -> None:
+        await self.backend.set(key, response.model_dump_json())
+
+    def record_bypass(self) -> None:
+        self.bypassed += 1
+        _ANALYSIS_BYPASS.inc()
+
+    async def stats(self) -> dict:
+        return {
+            "entries": await self.backend.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+        }
@@ -14,11 +14,112 @@ class Settings(BaseSettings):
     # If not found, default to 'gemini-1.5-pro'.
     # When you set it in .env, os.getenv will pick it up.
     GEMINI_MODEL_NAME: str = os.getenv("GEMINI_MODEL_NAME", "gemini-1.5-pro")
+    # Model tiering: calls go to this fast, cheap model first and escalate to GEMINI_MODEL_NAME
+    # when its reply fails validation, answers mostly 'Not available' or the request asks for
+    # quality 'high'. Leave it empty to send every call to GEMINI_MODEL_NAME.
+    GEMINI_FAST_MODEL_NAME: str = os.getenv("GEMINI_FAST_MODEL_NAME", "gemini-1.5-flash")
+    # Escalate an analysis when more than this fraction of its answers are 'Not available'
+    LLM_ESCALATE_NOT_AVAILABLE_RATIO: float = float(os.getenv("LLM_ESCALATE_NOT_AVAILABLE_RATIO", "0.5"))
+    # USD per million prompt/response tokens of each tier, for the per-tier cost metric
+    LLM_FAST_USD_PER_MTOK_PROMPT: float = float(os.getenv("LLM_FAST_USD_PER_MTOK_PROMPT", "0.075"))
+    LLM_FAST_USD_PER_MTOK_RESPONSE: float = float(os.getenv("LLM_FAST_USD_PER_MTOK_RESPONSE", "0.30"))
+    LLM_STRONG_USD_PER_MTOK_PROMPT: float = float(os.getenv("LLM_STRONG_USD_PER_MTOK_PROMPT", "1.25"))
+    LLM_STRONG_USD_PER_MTOK_RESPONSE: float = float(os.getenv("LLM_STRONG_USD_PER_MTOK_RESPONSE", "5.00"))
+
+    # Shared scraper HTTP client (created once per worker in the app lifespan)
+    SCRAPER_TIMEOUT_SECONDS: float = float(os.getenv("SCRAPER_TIMEOUT_SECONDS", "10.0"))
+    SCRAPER_MAX_CONNECTIONS: int = int(os.getenv("SCRAPER_MAX_CONNECTIONS", "100"))
+    SCRAPER_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("SCRAPER_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    SCRAPER_KEEPALIVE_EXPIRY_SECONDS: float = float(os.getenv("SCRAPER_KEEPALIVE_EXPIRY_SECONDS", "30.0"))
+    SCRAPER_MAX_CONNECTIONS_PER_HOST: int = int(os.getenv("SCRAPER_MAX_CONNECTIONS_PER_HOST", "6"))
+    SCRAPER_HTTP2: bool = os.getenv("SCRAPER_HTTP2", "true").lower() == "true"
+    # Download cap per page; bodies beyond it are not read (this also bounds what is parsed)
+    SCRAPER_MAX_BYTES: int = int(os.getenv("SCRAPER_MAX_BYTES", str(5 * 1024 * 1024)))
+    # HTML text extraction engine: 'stream' (single pass) or 'bs4' (BeautifulSoup tree)
+    HTML_EXTRACTOR: str = os.getenv("HTML_EXTRACTOR", "stream")
+    # Opt-in multi-page crawl (AnalysisRequest.crawl_depth > 0)
+    CRAWL_MAX_PAGES: int = int(os.getenv("CRAWL_MAX_PAGES", "6"))
+    CRAWL_PAGE_TEXT_LIMIT: int = int(os.getenv("CRAWL_PAGE_TEXT_LIMIT", "16000"))
+    CRAWL_CONCURRENCY_PER_HOST: int = int(os.getenv("CRAWL_CONCURRENCY_PER_HOST", "2"))
+    # robots.txt Crawl-delay is honored up to this many seconds
+    CRAWL_MAX_DELAY_SECONDS: float = float(os.getenv("CRAWL_MAX_DELAY_SECONDS", "2.0"))
+    ROBOTS_CACHE_TTL_SECONDS: float = float(os.getenv("ROBOTS_CACHE_TTL_SECONDS", "3600"))
+    ROBOTS_CACHE_MAX_ENTRIES: int = int(os.getenv("ROBOTS_CACHE_MAX_ENTRIES", "1000"))
+    # Off-loop parsing: documents at or above the threshold go to the process pool
+    PARSE_THREAD_WORKERS: int = int(os.getenv("PARSE_THREAD_WORKERS", "4"))
+    PARSE_PROCESS_WORKERS: int = int(os.getenv("PARSE_PROCESS_WORKERS", "2"))
+    PARSE_PROCESS_THRESHOLD_BYTES: int = int(os.getenv("PARSE_PROCESS_THRESHOLD_BYTES", str(512 * 1024)))
+
+    # Async Gemini client: max calls in flight per worker and per-call timeout
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+    LLM_TIMEOUT_SECONDS: float = float(os.getenv("LLM_TIMEOUT_SECONDS", "60.0"))
+    # Ask Gemini for JSON constrained by response schemas built from the Pydantic models,
+    # with compact prompts instead of the prose JSON structure (needs a model that supports it)
+    LLM_STRUCTURED_OUTPUT: bool = os.getenv("LLM_STRUCTURED_OUTPUT", "false").lower() == "true"
+    # Upstream governor: concurrency adapts (AIMD) between these bounds, calls waiting longer
+    # than the admission timeout are shed with 503, and 429/5xx errors are retried with backoff
+    LLM_MIN_CONCURRENCY: int = int(os.getenv("LLM_MIN_CONCURRENCY", "1"))
+    LLM_ADMISSION_TIMEOUT_SECONDS: float = float(os.getenv("LLM_ADMISSION_TIMEOUT_SECONDS", "10.0"))
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "3"))
+    LLM_RETRY_BASE_SECONDS: float = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+    LLM_RETRY_MAX_SECONDS: float = float(os.getenv("LLM_RETRY_MAX_SECONDS", "8.0"))
+    # Circuit breaker: open after this many consecutive overload failures, probe again after the reset
+    LLM_BREAKER_FAILURE_THRESHOLD: int = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+    LLM_BREAKER_RESET_SECONDS: float = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30.0"))
+
+    # /analyze/batch fan-out: concurrent scrapes and LLM calls per batch
+    BATCH_SCRAPE_CONCURRENCY: int = int(os.getenv("BATCH_SCRAPE_CONCURRENCY", "16"))
+    BATCH_LLM_CONCURRENCY: int = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+
+    # Asynchronous /analyze/jobs: worker pool, queue bound and result store
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "4"))
+    JOB_QUEUE_MAX_DEPTH: int = int(os.getenv("JOB_QUEUE_MAX_DEPTH", "1000"))
+    JOB_STORE_BACKEND: str = os.getenv("JOB_STORE_BACKEND", "memory")
+    JOB_STORE_MAX_ENTRIES: int = int(os.getenv("JOB_STORE_MAX_ENTRIES", "10000"))
+    JOB_RESULT_TTL_SECONDS: float = float(os.getenv("JOB_RESULT_TTL_SECONDS", "86400"))
+
+    # Server-side /chat/sessions: store bounds and history compaction budget
+    SESSION_MAX_SESSIONS: int = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+    SESSION_IDLE_TTL_SECONDS: float = float(os.getenv("SESSION_IDLE_TTL_SECONDS", "1800"))
+    SESSION_HISTORY_TOKEN_BUDGET: int = int(os.getenv("SESSION_HISTORY_TOKEN_BUDGET", "1500"))
+    SESSION_KEEP_RECENT_MESSAGES: int = int(os.getenv("SESSION_KEEP_RECENT_MESSAGES", "4"))
+
+    # /chat retrieval: pages are scraped well past the analysis limit and only the
+    # passages most relevant to each query (within the token budget) are sent to the model
+    CHAT_SCRAPE_TEXT_LIMIT: int = int(os.getenv("CHAT_SCRAPE_TEXT_LIMIT", "20000"))
+    CHAT_CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "600"))
+    CHAT_TOP_K_PASSAGES: int = int(os.getenv("CHAT_TOP_K_PASSAGES", "6"))
+    RETRIEVAL_INDEX_MAX_ENTRIES: int = int(os.getenv("RETRIEVAL_INDEX_MAX_ENTRIES", "256"))
+
+    # Rate limiting, keyed on the API key (client IP otherwise). The storage is shared by all
+    # workers: 'sqlite:///ratelimit.sqlite3', 'redis://host:6379' (needs the redis package) or 'memory://'
+    RATE_LIMIT_STORAGE_URI: str = os.getenv("RATE_LIMIT_STORAGE_URI", "sqlite:///ratelimit.sqlite3")
+    RATE_LIMIT_DEFAULT: str = os.getenv("RATE_LIMIT_DEFAULT", "60/minute")
+    RATE_LIMIT_ANALYZE: str = os.getenv("RATE_LIMIT_ANALYZE", "10/minute")
+    RATE_LIMIT_CHAT: str = os.getenv("RATE_LIMIT_CHAT", "30/minute")
+    # Worker processes sharing the SQLite storage; each admits at most limit / workers hits
+    # between syncs, so set it to the uvicorn worker count (WEB_CONCURRENCY when set)
+    RATE_LIMIT_WORKERS: int = int(os.getenv("RATE_LIMIT_WORKERS", os.getenv("WEB_CONCURRENCY", "1")))
+    # Proxies in front of the app whose X-Forwarded-For entries are trusted. 0 ignores the header;
+    # set it per deployment to the number of proxies that append to it (e.g. 1 behind Railway's
+    # or Render's router). A higher value lets clients pick their own rate limit bucket.
+    RATE_LIMIT_TRUSTED_PROXIES: int = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "0"))
+    # LLM tokens each client may consume per window (0 disables the quota)
+    LLM_TOKEN_QUOTA: int = int(os.getenv("LLM_TOKEN_QUOTA", "200000"))
+    LLM_TOKEN_QUOTA_WINDOW_SECONDS: int = int(os.getenv("LLM_TOKEN_QUOTA_WINDOW_SECONDS", "3600"))
+
+    # Caches: 'memory' is per-process, 'sqlite' survives restarts and is shared by workers
+    CACHE_SQLITE_PATH: str = os.getenv("CACHE_SQLITE_PATH", "cache.sqlite3")
+    SCRAPE_CACHE_BACKEND: str = os.getenv("SCRAPE_CACHE_BACKEND", "memory")
+    SCRAPE_CACHE_TTL_SECONDS: float = float(os.getenv("SCRAPE_CACHE_TTL_SECONDS", "900"))
+    # How long a stale entry is kept around for conditional revalidation
+    SCRAPE_CACHE_STALE_SECONDS: float = float(os.getenv("SCRAPE_CACHE_STALE_SECONDS", "86400"))
+    SCRAPE_CACHE_MAX_ENTRIES: int = int(os.getenv("SCRAPE_CACHE_MAX_ENTRIES", "1000"))
+    ANALYSIS_CACHE_BACKEND: str = os.getenv("ANALYSIS_CACHE_BACKEND", "memory")
+    ANALYSIS_CACHE_TTL_SECONDS: float = float(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", "3600"))
+    ANALYSIS_CACHE_MAX_ENTRIES: int = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "5000"))
 
     class Config:
         env_file = ".env"
 
 settings = Settings()
-
-# ADD THIS LINE to see what model name is actually being loaded
-print(f"DEBUG: GEMINI_MODEL_NAME loaded: {settings.GEMINI_MODEL_NAME}")
\ No newline at end of file
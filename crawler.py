@@ -0,0 +1,285 @@
+import asyncio
+import re
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import urldefrag, urlsplit
+from urllib.robotparser import RobotFileParser
+
+import httpx
+
+from cache import normalize_url
+from retrieval import BM25Index
+from scraper_client import ScraperClient
+
+ROBOTS_USER_AGENT = "WebsiteIntelligenceAgent"
+ROBOTS_MAX_BYTES = 512 * 1024   # Like major crawlers, ignore robots.txt content past ~500 KB
+
+# Pages worth crawling for company facts, best first; matched against URL path segments
+LINK_KEYWORDS = (
+    ("about", "about-us", "company", "who-we-are"),
+    ("contact", "contact-us", "get-in-touch", "support"),
+    ("team", "leadership", "people"),
+    ("pricing", "plans"),
+    ("careers", "jobs", "join-us"),
+    ("locations", "offices", "press", "newsroom"),
+)
+SKIPPED_EXTENSIONS = (".pdf", ".jpg", ".jpeg", ".png", ".gif", ".svg", ".webp", ".zip", ".mp4", ".xml", ".json")
+
+CHUNK_CHARS = 500       # Long lines (e.g. sparse-page body text) are split into windows of this size
+HOMEPAGE_LEAD_SHARE = 4  # 1/N of the budget always goes to the start of the homepage
+
+# Always ranked for, since the analysis prompt extracts these company fields
+DEFAULT_FOCUS_TERMS = (
+    "about company industry products services platform customers headquarters located location "
+    "office employees team size founded contact email phone linkedin twitter mission"
+)
+
+
+@dataclass
+class CrawledPage:
+    url: str
+    text: str
+
+
+# --- LINK DISCOVERY ---
+
+def _site(url: str) -> str:
+    """Host (and non-default port) with a leading 'www.' removed, so both spellings count as one site."""
+    parts = urlsplit(normalize_url(url))
+    return parts.netloc.removeprefix("www.")
+
+
+def _link_priority(url: str) -> Optional[int]:
+    path = urlsplit(url).path.lower()
+    if path.endswith(SKIPPED_EXTENSIONS):
+        return None
+    segments = [s for s in re.split(r"[/_.]", path) if s]
+    for priority, keywords in enumerate(LINK_KEYWORDS):
+        if any(segment in keywords or segment.split("-")[0] in keywords for segment in segments):
+            return priority
+    return None
+
+
+def discover_links(page_url: str, links: List[str], limit: int) -> List[str]:
+    """
+    Picks the same-site links worth crawling from a page's absolute hrefs,
+    ordered by LINK_KEYWORDS priority and then by position on the page.
+    """
+    site = _site(page_url)
+    own_key = normalize_url(page_url)
+    candidates: Dict[str, Tuple[int, int, str]] = {}
+    for position, link in enumerate(links):
+        link, _ = urldefrag(link)
+        parts = urlsplit(link)
+        if parts.scheme not in ("http", "https") or _site(link) != site:
+            continue
+        priority = _link_priority(link)
+        key = normalize_url(link)
+        if priority is None or key == own_key or key in candidates:
+            continue
+        candidates[key] = (priority, position, link)
+    return [link for _, _, link in sorted(candidates.values())[:limit]]
+
+
+# --- ROBOTS.TXT ---
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class _OriginSlot:
+    def __init__(self, limit: int):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.users = 0   # crawl fetches holding or waiting for the semaphore
+
+
+class RobotsCache:
+    """
+    Caches parsed robots.txt files per origin for crawl politeness.
+
+    Follows RFC 9309: a missing robots.txt (4xx) allows everything, while an
+    unreachable one (5xx or connection error) disallows crawling that origin
+    until the entry expires. Concurrent lookups for one origin share a fetch.
+    It also holds the crawl slots of each origin, shared by every crawl in the
+    process, so the per-host concurrency and Crawl-delay hold across requests.
+    """
+
+    def __init__(self, ttl: float = 3600.0, max_entries: int = 1000, concurrency: int = 2, max_delay: float = 2.0):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.concurrency = concurrency
+        self.max_delay = max_delay
+        self._entries: "OrderedDict[str, Tuple[RobotFileParser, float]]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # Only origins with crawl fetches in flight or waiting have an entry
+        self._slots: Dict[str, _OriginSlot] = {}
+        self.hits = 0
+        self.fetches = 0
+        self.disallowed = 0
+
+    @classmethod
+    def from_settings(cls, settings) -> "RobotsCache":
+        return cls(
+            ttl=settings.ROBOTS_CACHE_TTL_SECONDS,
+            max_entries=settings.ROBOTS_CACHE_MAX_ENTRIES,
+            concurrency=settings.CRAWL_CONCURRENCY_PER_HOST,
+            max_delay=settings.CRAWL_MAX_DELAY_SECONDS,
+        )
+
+    async def _fetch(self, origin: str, scraper: ScraperClient) -> RobotFileParser:
+        self.fetches += 1
+        parser = RobotFileParser(f"{origin}/robots.txt")
+        try:
+            async with scraper.stream(f"{origin}/robots.txt") as response:
+                if response.status_code >= 500:
+                    parser.disallow_all = True
+                elif response.status_code >= 400:
+                    parser.allow_all = True
+                else:
+                    # Stop downloading at the cap instead of reading an oversized file in full
+                    body = bytearray()
+                    async for chunk in response.aiter_bytes():
+                        body += chunk[:ROBOTS_MAX_BYTES - len(body)]
+                        if len(body) >= ROBOTS_MAX_BYTES:
+                            break
+                    parser.parse(body.decode("utf-8", errors="replace").splitlines())
+        except httpx.RequestError as e:
+            print(f"DEBUG: Could not fetch robots.txt for {origin}: {e}")
+            parser.disallow_all = True
+            return parser
+        parser.modified()
+        return parser
+
+    async def get(self, url: str, scraper: ScraperClient) -> RobotFileParser:
+        origin = _origin(url)
+        entry = self._entries.get(origin)
+        if entry is not None and time.monotonic() - entry[1] <= self.ttl:
+            self._entries.move_to_end(origin)
+            self.hits += 1
+            return entry[0]
+
+        lock = self._locks.setdefault(origin, asyncio.Lock())
+        async with lock:
+            # Another request may have fetched it while we waited
+            entry = self._entries.get(origin)
+            if entry is not None and time.monotonic() - entry[1] <= self.ttl:
+                self.hits += 1
+                return entry[0]
+            parser = await self._fetch(origin, scraper)
+            self._entries[origin] = (parser, time.monotonic())
+            self._entries.move_to_end(origin)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._locks.pop(evicted, None)
+        return parser
+
+    async def allowed(self, url: str, scraper: ScraperClient) -> bool:
+        parser = await self.get(url, scraper)
+        if parser.can_fetch(ROBOTS_USER_AGENT, url):
+            return True
+        self.disallowed += 1
+        return False
+
+    async def crawl_delay(self, url: str, scraper: ScraperClient) -> float:
+        parser = await self.get(url, scraper)
+        return float(parser.crawl_delay(ROBOTS_USER_AGENT) or 0)
+
+    @asynccontextmanager
+    async def slot(self, url: str, scraper: ScraperClient) -> AsyncIterator[None]:
+        """
+        Holds one of the origin's crawl slots: up to `concurrency` fetches at a
+        time, or one at a time followed by the Crawl-delay (capped at max_delay)
+        when robots.txt sets one.
+        """
+        origin = _origin(url)
+        delay = min(await self.crawl_delay(url, scraper), self.max_delay)
+        slot = self._slots.get(origin)
+        if slot is None:
+            slot = self._slots[origin] = _OriginSlot(1 if delay else self.concurrency)
+        slot.users += 1
+        try:
+            async with slot.semaphore:
+                try:
+                    yield
+                finally:
+                    if delay:
+                        await asyncio.sleep(delay)
+        finally:
+            slot.users -= 1
+            if not slot.users:
+                del self._slots[origin]
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "fetches": self.fetches,
+            "disallowed": self.disallowed,
+            "origins_crawling": len(self._slots),
+        }
+
+
+# --- RELEVANCE RANKING ---
+
+def _chunks(text: str) -> List[str]:
+    chunks = []
+    for line in text.split("\n"):
+        line = line.strip()
+        for start in range(0, len(line), CHUNK_CHARS):
+            chunks.append(line[start:start + CHUNK_CHARS])
+    return chunks
+
+
+def rank_passages(pages: List[CrawledPage], questions: List[str], budget: int) -> str:
+    """
+    Fills the text budget with the crawled chunks most relevant to the questions.
+
+    The opening of the homepage is always kept (it usually states what the
+    company does); the rest of the budget goes to the chunks with the best
+    BM25 score for the questions. Selected chunks are emitted in page order
+    under a [Page: path] header.
+    """
+    chunks: List[Tuple[int, int, str]] = []   # (page index, position, text)
+    seen = set()
+    for page_index, page in enumerate(pages):
+        for position, chunk in enumerate(_chunks(page.text)):
+            if chunk in seen:   # navigation and footers repeat on every page
+                continue
+            seen.add(chunk)
+            chunks.append((page_index, position, chunk))
+
+    selected = set()
+    used = 0
+    lead_budget = budget // HOMEPAGE_LEAD_SHARE
+    for i, (page_index, _, chunk) in enumerate(chunks):
+        if page_index != 0 or used + len(chunk) + 1 > lead_budget:
+            break
+        selected.add(i)
+        used += len(chunk) + 1
+
+    index = BM25Index([chunk for _, _, chunk in chunks])
+    scores = index.scores(" ".join(questions) + " " + DEFAULT_FOCUS_TERMS)
+    for i in sorted(range(len(chunks)), key=lambda i: (-scores[i], i)):
+        if i in selected or scores[i] <= 0:
+            continue
+        # Reserve room for a page header in case this is the page's first selected chunk
+        cost = len(chunks[i][2]) + 1 + len(pages[chunks[i][0]].url) + 10
+        if used + cost > budget:
+            continue
+        selected.add(i)
+        used += cost
+
+    sections: List[str] = []
+    current_page = None
+    for i in sorted(selected):
+        page_index, _, chunk = chunks[i]
+        if page_index != current_page:
+            current_page = page_index
+            path = urlsplit(pages[page_index].url).path or "/"
+            sections.append(f"[Page: {path}]")
+        sections.append(chunk)
+    return "\n".join(sections)[:budget]
@@ -1,6 +1,11 @@
-from fastapi import Security, HTTPException, status
+from fastapi import Security, HTTPException, Request, status
 from fastapi.security import APIKeyHeader
 from config import settings
+from jobs import AnalysisJobQueue
+from llm_router import ModelRouter
+from rate_limit import client_key, current_client, token_quota
+from scraper_client import ScraperClient
+from sessions import SessionStore
 
 API_KEY_HEADER = APIKeyHeader(name="Authorization")
 
@@ -13,3 +18,40 @@ async def get_api_key(api_key_header: str = Security(API_KEY_HEADER)):
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or missing API Key",
         )
+
+
+def get_scraper_client(request: Request) -> ScraperClient:
+    """Returns the pooled scraper client created in the application lifespan."""
+    return request.app.state.scraper_client
+
+
+def get_llm_client(request: Request) -> ModelRouter:
+    """Returns the long-lived Gemini model router created in the application lifespan."""
+    return request.app.state.llm_client
+
+
+def get_job_queue(request: Request) -> AnalysisJobQueue:
+    """Returns the analysis job queue started in the application lifespan."""
+    return request.app.state.job_queue
+
+
+def get_session_store(request: Request) -> SessionStore:
+    """Returns the chat session store created in the application lifespan."""
+    return request.app.state.session_store
+
+
+def cache_allowed(request: Request) -> bool:
+    """False when the client sent Cache-Control: no-cache (or no-store) to bypass cached results."""
+    cache_control = request.headers.get("cache-control", "").lower()
+    return "no-cache" not in cache_control and "no-store" not in cache_control
+
+
+async def enforce_token_quota(request: Request) -> str:
+    """
+    Refuses clients that used up their LLM token quota (429) and tags the
+    request so the tokens its LLM calls consume are charged to the client.
+    """
+    client = client_key(request)
+    token_quota.check(client)
+    current_client.set(client)
+    return client
@@ -0,0 +1,237 @@
+from html.parser import HTMLParser
+from typing import List, Optional, Tuple
+
+TEXT_CONTENT_LIMIT = 4000   # Limit content to avoid overly long prompts
+MIN_CONTENT_LENGTH = 200    # Below this, fall back to the whole body text
+
+CAPTURE_TAGS = {"p", "h1", "h2", "h3", "h4", "h5", "h6"}
+SKIP_TAGS = {"script", "style", "template"}
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr",
+}
+FEED_CHUNK_SIZE = 16384
+MAX_LINKS = 500             # Bound on hrefs collected per page for crawl discovery
+
+
+class _Capture:
+    __slots__ = ("tag", "parts")
+
+    def __init__(self, tag: str):
+        self.tag = tag
+        self.parts: List[str] = []
+
+
+class StreamingTextExtractor(HTMLParser):
+    """
+    Single-pass extractor for paragraph and heading text.
+
+    Reproduces the BeautifulSoup path (get_text(strip=True) per <p>/<h1>-<h6>,
+    with the body text as a fallback for sparse pages) from parser events,
+    without building a tree. Blocks are kept in document order with stable
+    de-duplication, and parsing stops as soon as the text budget is filled.
+    With collect_links=True the whole document is read so that every <a href>
+    can be collected for crawling.
+    """
+
+    def __init__(self, limit: Optional[int] = TEXT_CONTENT_LIMIT, collect_links: bool = False):
+        super().__init__(convert_charrefs=True)
+        self.limit = limit
+        self.done = False
+        self.links: Optional[List[str]] = [] if collect_links else None
+        self._open_tags: List[str] = []
+        self._captures: List[_Capture] = []
+        self._skip_depth = 0
+        self._in_body = False
+        # Slots are reserved when an element opens so output follows start-tag order
+        self._blocks: List[Optional[str]] = []
+        self._capture_slots: List[int] = []
+        self._seen = set()
+        self._block_chars = 0
+        self._body_parts: List[str] = []
+        self._body_chars = 0
+        # Text runs can arrive split across feed() calls; they are joined until the next tag
+        self._pending_text: List[str] = []
+
+    # --- parser events ---
+
+    def handle_starttag(self, tag, attrs):
+        self._flush_text()
+        if self.done:
+            return
+        if tag == "body":
+            self._in_body = True
+        if tag == "a" and self.links is not None and len(self.links) < MAX_LINKS:
+            href = dict(attrs).get("href")
+            if href:
+                self.links.append(href.strip())
+        if tag in VOID_TAGS:
+            return
+        self._open_tags.append(tag)
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in CAPTURE_TAGS:
+            self._captures.append(_Capture(tag))
+            self._capture_slots.append(len(self._blocks))
+            self._blocks.append(None)
+
+    def handle_startendtag(self, tag, attrs):
+        self._flush_text()
+        if tag == "body":
+            self._in_body = True
+
+    def handle_endtag(self, tag):
+        self._flush_text()
+        if self.done or tag not in self._open_tags:
+            return
+        # Like BeautifulSoup, a closing tag also closes anything left open inside it
+        self._pop_until(tag)
+
+    def handle_data(self, data):
+        if not self.done:
+            self._pending_text.append(data)
+
+    def handle_comment(self, data):
+        self._flush_text()
+
+    handle_decl = handle_pi = handle_comment
+
+    # --- helpers ---
+
+    def _flush_text(self):
+        if not self._pending_text:
+            return
+        data = "".join(self._pending_text)
+        self._pending_text.clear()
+        if self.done or self._skip_depth:
+            return
+        text = data.strip()
+        if not text:
+            return
+        for capture in self._captures:
+            capture.parts.append(text)
+        if self._in_body and (self.limit is None or self._body_chars < self.limit):
+            self._body_parts.append(text)
+            self._body_chars += len(text) + 1
+
+    def _pop_until(self, tag: Optional[str]):
+        """Closes open elements up to and including tag (all of them if tag is None)."""
+        while self._open_tags:
+            open_tag = self._open_tags.pop()
+            if open_tag in SKIP_TAGS:
+                self._skip_depth -= 1
+            elif open_tag in CAPTURE_TAGS:
+                self._close_capture()
+            if open_tag == "body":
+                self._in_body = False
+            if open_tag == tag:
+                break
+
+    def _close_capture(self):
+        capture = self._captures.pop()
+        slot = self._capture_slots.pop()
+        text = "".join(capture.parts)
+        if not text or text in self._seen:
+            return
+        self._seen.add(text)
+        self._blocks[slot] = text
+        self._block_chars += len(text) + 1
+        if self.links is None and self.limit is not None and self._block_chars > self.limit and not self._captures:
+            # Every earlier block is complete, so the budget can only be filled from here on
+            self.done = True
+
+    def feed_all(self, html: str) -> "StreamingTextExtractor":
+        """Feeds a whole document in chunks, stopping early once the budget is filled."""
+        for start in range(0, len(html), FEED_CHUNK_SIZE):
+            self.feed(html[start:start + FEED_CHUNK_SIZE])
+            if self.done:
+                break
+        return self
+
+    def finish(self) -> None:
+        """Flushes elements left open at the end of the document."""
+        if self.done:
+            return
+        self.close()
+        self._flush_text()
+        if not self.done:
+            self._pop_until(None)
+
+    @property
+    def blocks(self) -> List[str]:
+        return [b for b in self._blocks if b]
+
+    @property
+    def text(self) -> str:
+        text_content = "\n".join(self.blocks)
+        if len(text_content) < MIN_CONTENT_LENGTH:
+            text_content = " ".join(self._body_parts)
+        return text_content if self.limit is None else text_content[:self.limit]
+
+
+def extract_text_stream(html: str, limit: Optional[int] = TEXT_CONTENT_LIMIT) -> str:
+    """Extracts prompt text with the single-pass streaming extractor."""
+    extractor = StreamingTextExtractor(limit).feed_all(html)
+    extractor.finish()
+    return extractor.text
+
+
+def extract_text_bs4(html: str, limit: Optional[int] = TEXT_CONTENT_LIMIT) -> str:
+    """Extracts prompt text with BeautifulSoup (the original, tree-building path)."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # Prioritize visible text content from common elements
+    paragraphs = [p.get_text(strip=True) for p in soup.find_all('p') if p.get_text(strip=True)]
+    headings = [h.get_text(strip=True) for h in soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']) if h.get_text(strip=True)]
+
+    # Combine content, removing duplicates and ensuring readability
+    content_list = list(set(paragraphs + headings))
+    text_content = "\n".join(content_list)
+
+    # Fallback to body text if specific elements are scarce
+    if len(text_content) < MIN_CONTENT_LENGTH:
+        body_text = soup.body.get_text(separator=' ', strip=True) if soup.body else ''
+        text_content = body_text
+
+    return text_content if limit is None else text_content[:limit]
+
+
+EXTRACTORS = {
+    "stream": extract_text_stream,
+    "bs4": extract_text_bs4,
+}
+
+
+def extract_text(html: str, engine: str = "stream", limit: Optional[int] = TEXT_CONTENT_LIMIT) -> str:
+    """
+    Extracts the prompt-worthy text content from an HTML document with the
+    configured engine, falling back to BeautifulSoup if the engine fails.
+    """
+    try:
+        return EXTRACTORS[engine](html, limit)
+    except Exception as e:
+        if engine == "bs4":
+            raise
+        print(f"DEBUG: {engine} extractor failed, falling back to BeautifulSoup: {e}")
+        return extract_text_bs4(html, limit)
+
+
+def extract_page(
+    html: str, engine: str = "stream", limit: Optional[int] = TEXT_CONTENT_LIMIT, collect_links: bool = False
+) -> Tuple[str, List[str]]:
+    """
+    Like extract_text(), plus the document's raw hrefs with collect_links=True.
+    Links are always found by the streaming extractor (which then also provides
+    the text); if it fails, the text comes from BeautifulSoup and no links are returned.
+    """
+    if not collect_links:
+        return extract_text(html, engine, limit), []
+    try:
+        extractor = StreamingTextExtractor(limit, collect_links=True).feed_all(html)
+        extractor.finish()
+        return extractor.text, extractor.links
+    except Exception as e:
+        print(f"DEBUG: stream extractor failed, falling back to BeautifulSoup: {e}")
+        return extract_text_bs4(html, limit), []
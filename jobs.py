@@ -0,0 +1,208 @@
+import asyncio
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from fastapi import HTTPException
+
+from cache import CacheBackend, create_cache_backend
+from llm_router import ModelRouter
+from rate_limit import current_client
+from scraper_client import ScraperClient
+from stats import DurationStats
+import models
+import services
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue is at capacity and cannot accept more work."""
+
+
+class JobStore:
+    """
+    Persists AnalysisJob records on top of a cache backend.
+
+    The in-memory backend keeps jobs local to one worker; the SQLite backend
+    lets any uvicorn worker answer a status poll for a job queued on another.
+    """
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+
+    @classmethod
+    def from_settings(cls, settings) -> "JobStore":
+        return cls(create_cache_backend(
+            settings.JOB_STORE_BACKEND,
+            namespace="jobs",
+            max_entries=settings.JOB_STORE_MAX_ENTRIES,
+            max_age=settings.JOB_RESULT_TTL_SECONDS,
+            sqlite_path=settings.CACHE_SQLITE_PATH,
+        ))
+
+    async def save(self, job: models.AnalysisJob) -> None:
+        await self.backend.set(job.job_id, job.model_dump_json())
+
+    async def get(self, job_id: str) -> Optional[models.AnalysisJob]:
+        entry = await self.backend.get(job_id)
+        if entry is None:
+            return None
+        return models.AnalysisJob.model_validate_json(entry.value)
+
+
+class AnalysisJobQueue:
+    """
+    In-process queue and worker pool for asynchronous /analyze jobs.
+
+    Submitting returns immediately with a job id; a fixed number of worker
+    tasks drain the queue through services.get_website_analysis and record
+    the outcome in the job store for polling.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        scraper: ScraperClient,
+        llm: ModelRouter,
+        workers: int = 4,
+        max_depth: int = 1000,
+    ):
+        self.store = store
+        self.scraper = scraper
+        self.llm = llm
+        self.worker_count = workers
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_depth)
+        self._workers: List[asyncio.Task] = []
+        self._busy = 0
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.rejected = 0
+        self.store_errors = 0
+        self.wait_time = DurationStats()
+        self.run_time = DurationStats()
+
+    @classmethod
+    def from_settings(cls, settings, scraper: ScraperClient, llm: ModelRouter) -> "AnalysisJobQueue":
+        return cls(
+            JobStore.from_settings(settings),
+            scraper,
+            llm,
+            workers=settings.JOB_WORKERS,
+            max_depth=settings.JOB_QUEUE_MAX_DEPTH,
+        )
+
+    def start(self) -> None:
+        for i in range(self.worker_count):
+            self._workers.append(asyncio.create_task(self._worker(), name=f"analysis-job-worker-{i}"))
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        await self.store.backend.aclose()
+
+    async def submit(self, request: models.AnalysisRequest, use_cache: bool = True) -> models.AnalysisJob:
+        """Queues an analysis and returns its initial job record."""
+        job = models.AnalysisJob(
+            job_id=uuid.uuid4().hex,
+            url=request.url,
+            status="queued",
+            created_at=datetime.now(timezone.utc),
+        )
+        if self._queue.full():
+            self.rejected += 1
+            raise QueueFullError("Analysis job queue is full")
+        # Persist before enqueueing so a worker never picks up an unknown job id
+        await self.store.save(job)
+        # The submitting client is charged for the job's LLM usage
+        self._queue.put_nowait((job.job_id, request, use_cache, current_client.get(), time.monotonic()))
+        self.submitted += 1
+        return job
+
+    async def get(self, job_id: str) -> Optional[models.AnalysisJob]:
+        return await self.store.get(job_id)
+
+    async def _worker(self) -> None:
+        while True:
+            job_id, request, use_cache, client, enqueued_at = await self._queue.get()
+            self._busy += 1
+            current_client.set(client)
+            try:
+                await self._run(job_id, request, use_cache, enqueued_at)
+            except Exception as e:
+                # A job store error (e.g. SQLite locked or disk full) must not stop the worker
+                print(f"DEBUG: Job store error for analysis job {job_id}: {e}")
+                self.store_errors += 1
+                await self._mark_failed(job_id, e)
+            finally:
+                self._busy -= 1
+                self._queue.task_done()
+
+    async def _mark_failed(self, job_id: str, error: Exception) -> None:
+        """Best effort: records a job the worker could not finish as failed, so polls do not see it running forever."""
+        try:
+            job = await self.store.get(job_id)
+            if job is None or job.status not in ("queued", "running"):
+                return
+            job.status = "failed"
+            job.error = f"Job could not be completed: {error}"
+            job.error_status_code = 500
+            job.finished_at = datetime.now(timezone.utc)
+            await self.store.save(job)
+            self.failed += 1
+        except Exception as e:
+            print(f"DEBUG: Could not mark analysis job {job_id} as failed: {e}")
+
+    async def _run(self, job_id: str, request: models.AnalysisRequest, use_cache: bool, enqueued_at: float) -> None:
+        started = time.monotonic()
+        self.wait_time.observe(started - enqueued_at)
+
+        job = await self.store.get(job_id)
+        if job is None:
+            # Expired from the store before a worker picked it up; nobody can poll it anymore
+            return
+        job.status = "running"
+        job.started_at = datetime.now(timezone.utc)
+        await self.store.save(job)
+
+        try:
+            job.result = await services.get_website_analysis(
+                str(request.url), request.questions, self.scraper, self.llm,
+                use_cache=use_cache, crawl_depth=request.crawl_depth,
+                high_quality=request.quality == "high"
+            )
+            job.status = "succeeded"
+            self.succeeded += 1
+        except HTTPException as e:
+            job.status = "failed"
+            job.error = str(e.detail)
+            job.error_status_code = e.status_code
+            self.failed += 1
+        except Exception as e:
+            print(f"DEBUG: Unexpected error in analysis job {job_id}: {e}")
+            job.status = "failed"
+            job.error = str(e)
+            job.error_status_code = 500
+            self.failed += 1
+        finally:
+            self.run_time.observe(time.monotonic() - started)
+
+        job.finished_at = datetime.now(timezone.utc)
+        await self.store.save(job)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "max_depth": self._queue.maxsize,
+            "workers": self.worker_count,
+            "busy_workers": self._busy,
+            "submitted": self.submitted,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "store_errors": self.store_errors,
+            "wait_time": self.wait_time.as_dict(),
+            "run_time": self.run_time.as_dict(),
+        }
@@ -0,0 +1,93 @@
+import re
+from typing import Optional
+
+_SIMPLE_ESCAPES = {
+    '"': '"', "\\": "\\", "/": "/",
+    "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t",
+}
+_HEX4 = re.compile(r"[0-9a-fA-F]{4}")
+_LOW_SURROGATE = re.compile(r"\\u[dD][c-fC-F][0-9a-fA-F]{2}")
+_LOW_SURROGATE_SAMPLE = "\\udc00"
+
+
+class StringFieldStreamer:
+    """
+    Incrementally decodes one top-level string field from a JSON document that
+    arrives in arbitrary chunks, e.g. "agent_response" from a streamed LLM reply.
+
+    feed() returns only the newly decoded characters, so callers can forward
+    them to the client before the JSON document is complete. Malformed \\u
+    escapes are passed through as literal text and unpaired surrogates become
+    U+FFFD, so a sloppy model reply never stops the stream.
+    """
+
+    def __init__(self, field: str):
+        self._field_start = re.compile(r'"' + re.escape(field) + r'"\s*:\s*"')
+        self._buffer = ""
+        self._pos: Optional[int] = None   # index of the next undecoded char of the value
+        self.value = ""
+        self.complete = False
+
+    def feed(self, chunk: str) -> str:
+        self._buffer += chunk
+        if self.complete:
+            return ""
+        if self._pos is None:
+            match = self._field_start.search(self._buffer)
+            if not match:
+                return ""
+            self._pos = match.end()
+
+        decoded = []
+        buffer, pos = self._buffer, self._pos
+        while pos < len(buffer):
+            char = buffer[pos]
+            if char == '"':
+                self.complete = True
+                pos += 1
+                break
+            if char != "\\":
+                decoded.append(char)
+                pos += 1
+                continue
+            # Escape sequence: wait for more input if it is cut off mid-way
+            if pos + 1 >= len(buffer):
+                break
+            escape = buffer[pos + 1]
+            if escape == "u":
+                if pos + 6 > len(buffer):
+                    break
+                digits = buffer[pos + 2:pos + 6]
+                if not _HEX4.fullmatch(digits):
+                    decoded.append("\\u")
+                    pos += 2
+                    continue
+                code = int(digits, 16)
+                if 0xD800 <= code <= 0xDBFF:
+                    # High surrogate: decode together with the following low surrogate
+                    low = buffer[pos + 6:pos + 12]
+                    if len(low) < 6 and _LOW_SURROGATE.fullmatch(low + _LOW_SURROGATE_SAMPLE[len(low):]):
+                        break  # the low surrogate may still be arriving
+                    if _LOW_SURROGATE.fullmatch(low):
+                        decoded.append(chr(0x10000 + ((code - 0xD800) << 10) + int(low[2:], 16) - 0xDC00))
+                        pos += 12
+                        continue
+                    code = 0xFFFD
+                elif 0xDC00 <= code <= 0xDFFF:
+                    code = 0xFFFD
+                decoded.append(chr(code))
+                pos += 6
+                continue
+            decoded.append(_SIMPLE_ESCAPES.get(escape, escape))
+            pos += 2
+
+        self._pos = pos
+        text = "".join(decoded)
+        self.value += text
+        return text
+
+    @property
+    def buffer(self) -> str:
+        """Everything fed so far (the raw, possibly partial, JSON text)."""
+        return self._buffer
+
@@ -0,0 +1,310 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+import metrics
+from upstream import UpstreamGovernor, UpstreamOverloadedError, is_overload_error
+
+if TYPE_CHECKING:
+    from google.ai import generativelanguage as glm
+
+
+def _record_error(exc: BaseException) -> None:
+    if isinstance(exc, UpstreamOverloadedError):
+        kind = "shed"
+    elif isinstance(exc, asyncio.TimeoutError):
+        kind = "timeout"
+    elif is_overload_error(exc):
+        kind = "overload"
+    else:
+        kind = "error"
+    metrics.upstream_errors.labels("gemini", kind).inc()
+
+
+class LLMTimeoutError(Exception):
+    """Raised when a Gemini call does not finish within the configured timeout."""
+
+
+@lru_cache(maxsize=None)
+def _gemini_sdk(api_key: Optional[str]):
+    """
+    Imports and configures the Gemini SDK on first use. The import takes most
+    of a worker's boot time, so it happens in the readiness step (or the
+    first call) rather than when the app is imported.
+    """
+    import google.generativeai as genai
+
+    genai.configure(api_key=api_key)
+    return genai
+
+
+def _to_gemini_schema(schema: dict, defs: dict) -> dict:
+    """
+    Converts one node of a Pydantic JSON schema to Gemini's Schema subset:
+    $refs are inlined, Optional[...] becomes nullable, unions keep their first
+    non-null variant, and keywords Gemini does not know (title, default,
+    format, length limits) are dropped.
+    """
+    description = schema.get("description")
+    if "$ref" in schema:
+        converted = _to_gemini_schema(defs[schema["$ref"].rsplit("/", 1)[-1]], defs)
+    elif "anyOf" in schema:
+        variants = [variant for variant in schema["anyOf"] if variant.get("type") != "null"]
+        converted = _to_gemini_schema(variants[0], defs)
+        if len(variants) < len(schema["anyOf"]):
+            converted["nullable"] = True
+    elif "enum" in schema:
+        converted = {"type_": "STRING", "enum": [str(value) for value in schema["enum"]]}
+    else:
+        converted = {"type_": schema["type"].upper()}
+        if schema["type"] == "object":
+            properties = schema.get("properties", {})
+            converted["properties"] = {name: _to_gemini_schema(prop, defs) for name, prop in properties.items()}
+            # Every field is requested; optional ones are nullable, so the model answers null explicitly
+            converted["required"] = list(properties)
+        elif schema["type"] == "array":
+            converted["items"] = _to_gemini_schema(schema["items"], defs)
+    if description:
+        converted["description"] = description
+    return converted
+
+
+@lru_cache(maxsize=None)
+def response_schema(model: Type[BaseModel]) -> "glm.Schema":
+    """The Gemini response schema for a Pydantic model, built once per model class."""
+    from google.ai import generativelanguage as glm
+
+    schema = model.model_json_schema()
+    return glm.Schema(_to_gemini_schema(schema, schema.get("$defs", {})))
+
+
+class LLMClient:
+    """
+    Long-lived, non-blocking wrapper around a Gemini GenerativeModel.
+
+    The SDK is imported and the model object built by load() (run through
+    warm_up() in the app's readiness step, or by the first call otherwise),
+    then reused for every call. Calls go through
+    the SDK's async generation when it is available, falling back to a bounded
+    thread pool otherwise, so a slow completion never blocks the event loop.
+    An UpstreamGovernor adapts the number of calls in flight per worker to
+    Gemini's overload signals, retries 429/5xx errors and sheds calls it
+    cannot admit. Token usage reported by Gemini is counted, priced at
+    usd_per_mtok (prompt, response) and passed to on_usage (e.g. a quota).
+    Metrics are labelled with the client's tier (see ModelRouter). Passing a
+    response_model asks Gemini for JSON constrained to that model's schema.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        api_key: Optional[str] = None,
+        max_concurrency: int = 32,
+        timeout: float = 60.0,
+        on_usage: Optional[Callable[[int], None]] = None,
+        governor: Optional[UpstreamGovernor] = None,
+        tier: str = "strong",
+        usd_per_mtok: Tuple[float, float] = (0.0, 0.0),
+    ):
+        self.model_name = model_name
+        self.api_key = api_key
+        self.tier = tier
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.on_usage = on_usage
+        self.governor = governor or UpstreamGovernor(max_concurrency=max_concurrency)
+        self._model = None
+        self._use_async_sdk = False
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._load_lock = threading.Lock()
+        self._calls = 0
+        self._timeouts = 0
+        self._errors = 0
+        self._tokens = 0
+        self._cost_usd = 0.0
+        self._usd_per_mtok = usd_per_mtok
+        self._call_seconds = metrics.llm_call_seconds.labels(tier)
+        self._prompt_tokens = metrics.llm_tokens.labels(tier, "prompt")
+        self._response_tokens = metrics.llm_tokens.labels(tier, "response")
+        self._cost = metrics.llm_cost.labels(tier)
+
+    @classmethod
+    def from_settings(
+        cls, settings, on_usage: Optional[Callable[[int], None]] = None, tier: str = "strong"
+    ) -> "LLMClient":
+        if tier == "fast":
+            model_name = settings.GEMINI_FAST_MODEL_NAME
+            usd_per_mtok = (settings.LLM_FAST_USD_PER_MTOK_PROMPT, settings.LLM_FAST_USD_PER_MTOK_RESPONSE)
+        else:
+            model_name = settings.GEMINI_MODEL_NAME
+            usd_per_mtok = (settings.LLM_STRONG_USD_PER_MTOK_PROMPT, settings.LLM_STRONG_USD_PER_MTOK_RESPONSE)
+        return cls(
+            model_name=model_name,
+            api_key=settings.GEMINI_API_KEY,
+            max_concurrency=settings.LLM_MAX_CONCURRENCY,
+            timeout=settings.LLM_TIMEOUT_SECONDS,
+            on_usage=on_usage,
+            governor=UpstreamGovernor.from_settings(settings),
+            tier=tier,
+            usd_per_mtok=usd_per_mtok,
+        )
+
+    @property
+    def ready(self) -> bool:
+        return self._model is not None
+
+    def load(self) -> None:
+        """Imports the SDK and builds the model. Blocking; later calls return at once."""
+        with self._load_lock:
+            if self._model is not None:
+                return
+            model = _gemini_sdk(self.api_key).GenerativeModel(self.model_name)
+            self._use_async_sdk = hasattr(model, "generate_content_async")
+            if not self._use_async_sdk:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="gemini")
+            self._model = model
+
+    async def warm_up(self) -> None:
+        """Runs load() off the event loop."""
+        if self._model is None:
+            await asyncio.to_thread(self.load)
+
+    def _record_usage(self, response) -> None:
+        usage = getattr(response, "usage_metadata", None)
+        prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        response_tokens = getattr(usage, "candidates_token_count", 0) or 0
+        self._prompt_tokens.inc(prompt_tokens)
+        self._response_tokens.inc(response_tokens)
+        cost = (prompt_tokens * self._usd_per_mtok[0] + response_tokens * self._usd_per_mtok[1]) / 1_000_000
+        if cost:
+            self._cost_usd += cost
+            self._cost.inc(cost)
+        tokens = getattr(usage, "total_token_count", 0) or 0
+        if not tokens:
+            return
+        self._tokens += tokens
+        if self.on_usage is not None:
+            self.on_usage(tokens)
+
+    @staticmethod
+    def _generation_config(response_model: Optional[Type[BaseModel]]) -> Optional[dict]:
+        if response_model is None:
+            return None
+        return {"response_mime_type": "application/json", "response_schema": response_schema(response_model)}
+
+    async def _generate_content(self, prompt: str, generation_config: Optional[dict] = None):
+        if self._use_async_sdk:
+            return await self._model.generate_content_async(
+                prompt, generation_config=generation_config, request_options={"timeout": self.timeout}
+            )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, lambda: self._model.generate_content(prompt, generation_config=generation_config)
+        )
+
+    async def generate(self, prompt: str, response_model: Optional[Type[BaseModel]] = None) -> str:
+        """Sends a prompt to Gemini without blocking the event loop and returns the text."""
+        await self.warm_up()
+        self._calls += 1
+        started = time.perf_counter()
+        generation_config = self._generation_config(response_model)
+        try:
+            response = await self.governor.call(
+                lambda: asyncio.wait_for(self._generate_content(prompt, generation_config), timeout=self.timeout)
+            )
+            self._record_usage(response)
+            return response.text
+        except asyncio.TimeoutError as e:
+            self._timeouts += 1
+            _record_error(e)
+            raise LLMTimeoutError(f"Gemini call exceeded {self.timeout}s")
+        except Exception as e:
+            self._errors += 1
+            _record_error(e)
+            raise
+        finally:
+            # Includes governor queueing and retries: the time the request waited on Gemini
+            elapsed = time.perf_counter() - started
+            metrics.LLM_CALL.observe(elapsed)
+            self._call_seconds.observe(elapsed)
+
+    async def stream(self, prompt: str, response_model: Optional[Type[BaseModel]] = None) -> AsyncIterator[str]:
+        """
+        Yields text chunks as Gemini produces them. The timeout bounds the whole
+        generation; without the async SDK the full completion arrives as one chunk.
+        Streams hold a governor slot but are not retried, since text may
+        already have reached the client.
+        """
+        await self.warm_up()
+        self._calls += 1
+        started = time.perf_counter()
+        deadline = time.monotonic() + self.timeout
+        generation_config = self._generation_config(response_model)
+        try:
+            async with self.governor.admit():
+                if not self._use_async_sdk:
+                    response = await asyncio.wait_for(
+                        self._generate_content(prompt, generation_config), timeout=self.timeout
+                    )
+                    self._record_usage(response)
+                    yield response.text
+                    return
+
+                response = await asyncio.wait_for(
+                    self._model.generate_content_async(
+                        prompt, stream=True, generation_config=generation_config,
+                        request_options={"timeout": self.timeout}
+                    ),
+                    timeout=self.timeout,
+                )
+                chunks = response.__aiter__()
+                last_chunk = None
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout=deadline - time.monotonic())
+                    except StopAsyncIteration:
+                        break
+                    last_chunk = chunk
+                    if chunk.text:
+                        yield chunk.text
+                # Streamed responses report cumulative usage on the final chunk
+                if last_chunk is not None:
+                    self._record_usage(last_chunk)
+        except asyncio.TimeoutError as e:
+            self._timeouts += 1
+            _record_error(e)
+            raise LLMTimeoutError(f"Gemini call exceeded {self.timeout}s")
+        except Exception as e:
+            self._errors += 1
+            _record_error(e)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.LLM_CALL.observe(elapsed)
+            self._call_seconds.observe(elapsed)
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model_name,
+            "tier": self.tier,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.governor.in_flight,
+            "waiting": self.governor.waiting,
+            "calls": self._calls,
+            "timeouts": self._timeouts,
+            "errors": self._errors,
+            "tokens": self._tokens,
+            "cost_usd": round(self._cost_usd, 6),
+            "ready": self.ready,
+            "async_sdk": self._use_async_sdk,
+            "governor": self.governor.stats(),
+        }
+
+    async def aclose(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,197 @@
+import json
+import re
+from typing import List, Optional, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+import metrics
+
+M = TypeVar("M", bound=BaseModel)
+
+# Where a JSON object most likely starts: '{' followed by a key or '}' (skips braces in prose)
+_OBJECT_START = re.compile(r'\{\s*(?:"|\})')
+# A bare number or literal at the very end of a truncated reply may have been cut off
+_TRAILING_SCALAR = re.compile(r"[\w.+-]+$")
+_STRING_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+_CLEAN = metrics.llm_output_parses.labels("clean")
+_REPAIRED = metrics.llm_output_parses.labels("repaired")
+
+
+class LLMOutputError(Exception):
+    """Raised when LLM output cannot be turned into the expected model, even after repair."""
+
+    def __init__(self, message: str, raw: str):
+        super().__init__(message)
+        self.raw = raw
+
+
+def extract_json_object(text: str) -> Optional[str]:
+    """
+    Returns the outermost JSON object in text, ignoring any preamble, code
+    fences or trailing commentary. An object that is never closed (a
+    truncated reply) is returned up to the end of the text so it can be
+    repaired. Returns None when the text holds no object at all.
+    """
+    match = _OBJECT_START.search(text)
+    start = match.start() if match else text.find("{")
+    if start < 0:
+        return None
+
+    depth = 0
+    in_string = escaped = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return text[start:].rstrip().removesuffix("```").rstrip()
+
+
+def repair_json(candidate: str) -> str:
+    """
+    Fixes the defects LLMs commonly produce in otherwise valid JSON: trailing
+    commas, raw newlines or tabs inside strings, and truncation (an unclosed
+    string or unclosed objects and arrays). Nothing is made up for a truncated
+    value: a dangling key or comma, and a number or literal that runs into the
+    end of the text, are dropped together with their key. The result is not
+    guaranteed to be valid JSON.
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    in_string = escaped = False
+    # Output index where the pending object key started, until its ':' arrives
+    key_start: Optional[int] = None
+    # Output index where the key of the latest ':' started
+    value_key_start: Optional[int] = None
+    expecting_key = False
+
+    for char in candidate:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            elif char in _STRING_CONTROL_ESCAPES:
+                char = _STRING_CONTROL_ESCAPES[char]
+            # One list item per character, so output indices stay text offsets
+            out.extend(char)
+            continue
+
+        if char == '"':
+            in_string = True
+            if expecting_key:
+                key_start = len(out)
+                expecting_key = False
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+            expecting_key = char == "{"
+        elif char in "}]":
+            _strip_trailing(out, ",")
+            if stack:
+                stack.pop()
+            expecting_key = False
+            key_start = None
+        elif char == ",":
+            expecting_key = bool(stack) and stack[-1] == "}"
+        elif char == ":":
+            value_key_start = key_start
+            key_start = None
+        out.append(char)
+
+    if not stack and not in_string:
+        return "".join(out)
+
+    # Truncated reply: finish the value in progress, then close every open container
+    if in_string:
+        if escaped:
+            out.pop()
+        out.append('"')
+        if key_start is not None:
+            # The string was an object key with no value yet
+            del out[key_start:]
+    elif key_start is not None:
+        del out[key_start:]
+    text = "".join(out)
+    scalar = _TRAILING_SCALAR.search(text)
+    if scalar and scalar.group() not in ("true", "false", "null"):
+        text = text[:scalar.start()]
+    text = text.rstrip()
+    if text.endswith(":"):
+        # The key's value is missing or was dropped above: drop the key as well
+        text = text[:value_key_start if value_key_start is not None else -1].rstrip()
+    if text.endswith(","):
+        text = text[:-1].rstrip()
+    # An array element cut off right after it opened carries nothing: drop it
+    while len(stack) > 1 and stack[-2] == "]" and text.endswith(("{", "[")):
+        stack.pop()
+        text = text[:-1].rstrip()
+        if text.endswith(","):
+            text = text[:-1].rstrip()
+    return text + "".join(reversed(stack))
+
+
+def _strip_trailing(out: List[str], char: str) -> None:
+    """Drops char (and the whitespace after it) from the end of out."""
+    i = len(out) - 1
+    while i >= 0 and out[i].isspace():
+        i -= 1
+    if i >= 0 and out[i] == char:
+        del out[i:]
+
+
+def _is_syntax_error(error: ValidationError) -> bool:
+    return any(e["type"] == "json_invalid" for e in error.errors())
+
+
+def parse_model(text: str, model: Type[M]) -> M:
+    """
+    Validates LLM output into model with Pydantic's JSON parser, tolerating
+    preamble, code fences and the defects repair_json() fixes. Raises
+    LLMOutputError when the output cannot be validated even after repair.
+    """
+    candidate = extract_json_object(text)
+    if candidate is None:
+        raise LLMOutputError("No JSON object found in the AI model's response", text)
+    try:
+        parsed = model.model_validate_json(candidate)
+        _CLEAN.inc()
+        return parsed
+    except ValidationError as e:
+        if not _is_syntax_error(e):
+            raise LLMOutputError(_describe(e), text)
+
+    try:
+        parsed = model.model_validate_json(repair_json(candidate))
+    except ValidationError as e:
+        raise LLMOutputError(_describe(e), text)
+    _REPAIRED.inc()
+    return parsed
+
+
+def _describe(error: ValidationError) -> str:
+    """A compact, prompt-friendly summary of what failed validation."""
+    problems = []
+    for e in error.errors()[:10]:
+        location = ".".join(str(part) for part in e["loc"]) or "(root)"
+        problems.append(f"{location}: {e['msg']}")
+    return "; ".join(problems)
+
+
+def schema_for_prompt(model: Type[BaseModel]) -> str:
+    """The model's JSON schema, compacted for use in a re-ask prompt."""
+    return json.dumps(model.model_json_schema(), separators=(",", ":"))
@@ -0,0 +1,79 @@
+import asyncio
+from typing import Callable, Dict, List, Optional
+
+import metrics
+from llm_client import LLMClient
+
+ROUTING_DECISIONS = ("fast", "high_quality", "escalated_invalid", "escalated_not_available")
+
+
+class ModelRouter:
+    """
+    Routes Gemini calls between two model tiers: a fast, cheap model that
+    takes every call first, and the strong model that a call escalates to
+    when the fast reply is not good enough, or that high-quality requests go
+    to directly. Each tier is its own LLMClient with its own governor, since
+    Gemini rate limits each model separately. Without a fast model every call
+    goes to the strong tier and no routing is recorded.
+
+    Callers walk route() in order and call record_escalation() whenever they
+    hand a call to the next tier; the escalation policy itself lives with the
+    callers, which know what a good reply looks like.
+    """
+
+    def __init__(self, strong: LLMClient, fast: Optional[LLMClient] = None, not_available_ratio: float = 0.5):
+        self.strong = strong
+        self.fast = fast
+        self.not_available_ratio = not_available_ratio
+        self._decisions: Dict[str, int] = {decision: 0 for decision in ROUTING_DECISIONS}
+        self._counters = {decision: metrics.llm_routing.labels(decision) for decision in ROUTING_DECISIONS}
+
+    @classmethod
+    def from_settings(cls, settings, on_usage: Optional[Callable[[int], None]] = None) -> "ModelRouter":
+        fast = None
+        if settings.GEMINI_FAST_MODEL_NAME and settings.GEMINI_FAST_MODEL_NAME != settings.GEMINI_MODEL_NAME:
+            fast = LLMClient.from_settings(settings, on_usage=on_usage, tier="fast")
+        return cls(
+            strong=LLMClient.from_settings(settings, on_usage=on_usage, tier="strong"),
+            fast=fast,
+            not_available_ratio=settings.LLM_ESCALATE_NOT_AVAILABLE_RATIO,
+        )
+
+    def tiers(self, high_quality: bool = False) -> List[LLMClient]:
+        """The clients a call may go through, cheapest first."""
+        if self.fast is None or high_quality:
+            return [self.strong]
+        return [self.fast, self.strong]
+
+    def route(self, high_quality: bool = False) -> List[LLMClient]:
+        """Like tiers(), and records the routing decision for one call."""
+        if self.fast is not None:
+            self._record("high_quality" if high_quality else "fast")
+        return self.tiers(high_quality)
+
+    def record_escalation(self, reason: str) -> None:
+        """Records that a fast reply was handed to the strong tier; reason is 'invalid' or 'not_available'."""
+        self._record(f"escalated_{reason}")
+
+    def _record(self, decision: str) -> None:
+        self._decisions[decision] += 1
+        self._counters[decision].inc()
+
+    @property
+    def ready(self) -> bool:
+        return all(client.ready for client in self.tiers())
+
+    async def warm_up(self) -> None:
+        """Loads every tier's model (see LLMClient.load) off the event loop."""
+        await asyncio.gather(*(client.warm_up() for client in self.tiers()))
+
+    def stats(self) -> dict:
+        return {
+            "routing": self.fast is not None,
+            "decisions": dict(self._decisions),
+            "tiers": {client.tier: client.stats() for client in self.tiers()},
+        }
+
+    async def aclose(self):
+        for client in self.tiers():
+            await client.aclose()
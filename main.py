@@ -1,29 +1,96 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
+from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
+from slowapi.middleware import SlowAPIASGIMiddleware
 from api import router as api_router
+from config import settings
+from jobs import AnalysisJobQueue
+from metrics import MetricsMiddleware
+from llm_client import response_schema
+from llm_router import ModelRouter
+from rate_limit import close_storage, limiter, token_quota
+from scraper_client import ScraperClient
+from sessions import SessionStore
+import services
 
-# Initialize the rate limiter
-limiter = Limiter(key_func=get_remote_address, default_limits=["10/minute"])
+# The rate limiter (keyed on the API key, shared across workers) lives in rate_limit.py
+
+def _build_response_schemas():
+    for model in services.STRUCTURED_OUTPUT_MODELS:
+        response_schema(model)
+
+
+async def warm_up(app: FastAPI):
+    """
+    Readiness step, run after startup so the worker serves /healthz at once:
+    imports the Gemini SDK and builds the models (and response schemas) off
+    the event loop, then marks the worker ready for /readyz.
+    """
+    started = time.perf_counter()
+    try:
+        await app.state.llm_client.warm_up()
+        if settings.LLM_STRUCTURED_OUTPUT:
+            # Build the Gemini response schemas before the first request needs them
+            await asyncio.to_thread(_build_response_schemas)
+    except Exception as e:
+        print(f"DEBUG: Warm-up failed: {e}")
+        app.state.warm_up_error = str(e)
+        return
+    app.state.warm_up_seconds = time.perf_counter() - started
+    models = ", ".join(f"{tier.tier}={tier.model_name}" for tier in app.state.llm_client.tiers())
+    print(f"DEBUG: Warm-up finished in {app.state.warm_up_seconds:.2f}s (models: {models})")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Creates application-lifetime resources on startup and releases them on shutdown."""
+    # One pooled scraper client per worker so repeat scrapes reuse warm connections
+    app.state.scraper_client = ScraperClient.from_settings(settings)
+    # Gemini models (fast and strong tier) with bounded, non-blocking concurrency; usage is
+    # charged to token quotas. The models themselves are built by the warm-up task below.
+    app.state.llm_client = ModelRouter.from_settings(settings, on_usage=token_quota.record)
+    app.state.warm_up_seconds = None
+    app.state.warm_up_error = None
+    app.state.warm_up = asyncio.create_task(warm_up(app))
+    # Worker pool for asynchronous /analyze/jobs
+    app.state.job_queue = AnalysisJobQueue.from_settings(
+        settings, app.state.scraper_client, app.state.llm_client
+    )
+    app.state.job_queue.start()
+    # Bounded store for server-side chat sessions
+    app.state.session_store = SessionStore.from_settings(settings)
+    yield
+    app.state.warm_up.cancel()
+    # Let the cancelled warm-up finish before its clients are closed
+    await asyncio.gather(app.state.warm_up, return_exceptions=True)
+    await app.state.job_queue.stop()
+    await app.state.scraper_client.aclose()
+    await app.state.llm_client.aclose()
+    await services.scrape_cache.backend.aclose()
+    await services.analysis_cache.backend.aclose()
+    services.parse_pool.shutdown()
+    close_storage()
 
 # Initialize the FastAPI app
 app = FastAPI(
     title="AI Website Intelligence Agent",
     description="An API for extracting business insights from websites using AI.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add state to the app for the limiter and handle rate limit exceptions
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
-# IMPORTANT: Remove the custom `rate_limit_middleware` if you are using
-# `default_limits` on the Limiter object and adding the exception handler.
-# The `slowapi` library will automatically apply the default limits to all routes
-# if configured this way, and the exception handler will catch `RateLimitExceeded`.
-# If you need per-route rate limiting, use `@limiter.limit("rate/time")` decorators
-# on your individual route functions in `api.py`.
+# The middleware applies RATE_LIMIT_DEFAULT to every route; /analyze and /chat
+# routes carry their own limits through `limiter.shared_limit` decorators in `api.py`.
+app.add_middleware(SlowAPIASGIMiddleware)
+# Added last so it is outermost and also times requests rejected by the rate limiter
+app.add_middleware(MetricsMiddleware)
 
 # Include the API router
 app.include_router(api_router)
@@ -0,0 +1,338 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Bucket upper bounds in seconds, from sub-millisecond parsing to slow LLM completions
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Shards:
+    """
+    Per-thread value arrays. Each thread only ever writes its own array, so
+    recording takes no lock; the lock is only taken the first time a thread
+    records and when a scrape sums the arrays.
+    """
+
+    def __init__(self, size: int):
+        self._size = size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._arrays: List[list] = []
+
+    def local(self) -> list:
+        values = getattr(self._local, "values", None)
+        if values is None:
+            values = [0] * self._size
+            with self._lock:
+                self._arrays.append(values)
+            self._local.values = values
+        return values
+
+    def totals(self) -> list:
+        with self._lock:
+            arrays = list(self._arrays)
+        return [sum(column) for column in zip(*arrays)] if arrays else [0] * self._size
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        """
+        Returns the child for one label combination. Hot paths should bind
+        their children once (at import time) and reuse them.
+        """
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+        child = self._children.get(values)
+        if child is None:
+            child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _default(self):
+        return self.labels()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(child.render(self.name, self.labelnames, values))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("_shards",)
+
+    def __init__(self):
+        self._shards = _Shards(1)
+
+    def inc(self, amount: float = 1) -> None:
+        self._shards.local()[0] += amount
+
+    @property
+    def value(self) -> float:
+        return self._shards.totals()[0]
+
+    def render(self, name: str, labelnames: Sequence[str], values: Sequence[str]) -> List[str]:
+        return [f"{name}{_format_labels(labelnames, values)} {_format_value(self.value)}"]
+
+
+class Counter(_Metric):
+    """Monotonic total, e.g. cache hits or bytes downloaded."""
+
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self._default().inc(amount)
+
+
+class _Timer:
+    __slots__ = ("_child", "_started")
+
+    def __init__(self, child: "_HistogramChild"):
+        self._child = child
+
+    def __enter__(self) -> "_Timer":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._child.observe(time.perf_counter() - self._started)
+
+
+class _HistogramChild:
+    __slots__ = ("_bounds", "_shards")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self._bounds = bounds
+        # One slot per bucket, one for +Inf, and the running sum last
+        self._shards = _Shards(len(bounds) + 2)
+
+    def observe(self, value: float) -> None:
+        values = self._shards.local()
+        values[bisect_left(self._bounds, value)] += 1
+        values[-1] += value
+
+    def time(self) -> _Timer:
+        """Context manager that observes the wall time of its block."""
+        return _Timer(self)
+
+    def snapshot(self) -> Tuple[int, float]:
+        """Returns (count, sum) of the observations so far."""
+        totals = self._shards.totals()
+        return sum(totals[:-1]), float(totals[-1])
+
+    def render(self, name: str, labelnames: Sequence[str], values: Sequence[str]) -> List[str]:
+        totals = self._shards.totals()
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self._bounds + (float("inf"),), totals):
+            cumulative += count
+            lines.append(
+                f"{name}_bucket{_format_labels(labelnames, values, ('le', _format_value(float(bound))))} {cumulative}"
+            )
+        lines.append(f"{name}_sum{_format_labels(labelnames, values)} {_format_value(float(totals[-1]))}")
+        lines.append(f"{name}_count{_format_labels(labelnames, values)} {cumulative}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Distribution of durations in fixed buckets."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default().observe(value)
+
+    def time(self) -> _Timer:
+        return self._default().time()
+
+
+class Registry:
+    """Holds the process's metrics and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Metrics are per worker process, like /stats; Prometheus sums them across targets
+registry = Registry()
+
+http_request_seconds = registry.histogram(
+    "wia_http_request_duration_seconds",
+    "Time to serve an HTTP request, by route template and status code.",
+    ("method", "route", "status"),
+)
+stage_seconds = registry.histogram(
+    "wia_stage_duration_seconds",
+    "Time spent in each stage of a request: scrape_fetch (download, including streamed extraction), "
+    "html_parse, prompt_build, llm_call and validation.",
+    ("stage",),
+)
+cache_requests = registry.counter(
+    "wia_cache_requests_total",
+    "Cache lookups by cache and result (hit, miss, stale or bypass).",
+    ("cache", "result"),
+)
+upstream_errors = registry.counter(
+    "wia_upstream_errors_total",
+    "Failed calls to upstreams (scraped websites and Gemini), by kind of failure.",
+    ("upstream", "kind"),
+)
+scraper_bytes = registry.counter(
+    "wia_scraper_downloaded_bytes_total",
+    "Response body bytes downloaded by the scraper.",
+)
+llm_tokens = registry.counter(
+    "wia_llm_tokens_total",
+    "Tokens reported in Gemini usage metadata, by model tier (fast or strong) and kind (prompt or response).",
+    ("tier", "kind"),
+)
+llm_call_seconds = registry.histogram(
+    "wia_llm_call_duration_seconds",
+    "Time a Gemini call took, including governor queueing and retries, by model tier.",
+    ("tier",),
+)
+llm_cost = registry.counter(
+    "wia_llm_cost_usd_total",
+    "Estimated Gemini spend from token usage and the configured per-tier prices.",
+    ("tier",),
+)
+llm_routing = registry.counter(
+    "wia_llm_routing_decisions_total",
+    "Model tier routing: fast (fast tier first), high_quality (strong tier on request), and "
+    "escalated_invalid / escalated_not_available when a fast reply was handed to the strong tier.",
+    ("decision",),
+)
+llm_output_parses = registry.counter(
+    "wia_llm_output_parses_total",
+    "Parsed LLM JSON replies: clean or repaired (fixed locally); reasked when a reply needed a "
+    "follow-up call to fix it, failed when even that did not help.",
+    ("result",),
+)
+
+# Children bound once so the hot paths skip the label lookup
+SCRAPE_FETCH = stage_seconds.labels("scrape_fetch")
+HTML_PARSE = stage_seconds.labels("html_parse")
+PROMPT_BUILD = stage_seconds.labels("prompt_build")
+LLM_CALL = stage_seconds.labels("llm_call")
+VALIDATION = stage_seconds.labels("validation")
+SCRAPED_BYTES = scraper_bytes.labels()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that observes every HTTP request's duration.
+
+    Requests are labelled with the matched route template (e.g.
+    /analyze/jobs/{job_id}) rather than the raw path, so the number of
+    series stays bounded; paths that match no route share 'unmatched'.
+    Streaming responses are timed until their last chunk is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: Optional[dict] = None
+
+    def _route_label(self, scope) -> str:
+        route = scope.get("route")
+        if route is not None:
+            return getattr(route, "path", "unmatched")
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._route_paths is None:
+            routes = getattr(scope.get("app"), "routes", ())
+            self._route_paths = {
+                getattr(r, "endpoint", None): r.path for r in routes if hasattr(r, "path")
+            }
+        return self._route_paths.get(endpoint, "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_request_seconds.labels(scope["method"], self._route_label(scope), str(status)).observe(
+                time.perf_counter() - started
+            )
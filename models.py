@@ -1,29 +1,52 @@
-from pydantic import BaseModel, HttpUrl, Field, RootModel
-from typing import List, Optional, Literal
+from datetime import datetime
+from pydantic import BaseModel, HttpUrl, Field, RootModel, model_validator
+from typing import Any, List, Optional, Literal, Union, get_args
+
+# Strings LLMs write instead of a JSON null
+NULL_STRINGS = {"", "null", "none"}
+
+class LLMOutputModel(BaseModel):
+    """Base for models filled from LLM JSON: 'null'-like strings in optional fields become None."""
+
+    @model_validator(mode="before")
+    @classmethod
+    def _null_strings_to_none(cls, data: Any) -> Any:
+        if not isinstance(data, dict):
+            return data
+        for name, field in cls.model_fields.items():
+            value = data.get(name)
+            if isinstance(value, str) and value.strip().lower() in NULL_STRINGS and type(None) in get_args(field.annotation):
+                data = {**data, name: None}
+        return data
 
 # Nested models for CompanyInfo
-class SocialMedia(BaseModel):
-    linkedin: Optional[HttpUrl] = None
-    twitter: Optional[HttpUrl] = None
+# Field descriptions double as instructions in Gemini response schemas (LLM_STRUCTURED_OUTPUT)
+class SocialMedia(LLMOutputModel):
+    linkedin: Optional[HttpUrl] = Field(None, description="LinkedIn URL if present, otherwise null.")
+    twitter: Optional[HttpUrl] = Field(None, description="Twitter URL if present, otherwise null.")
 
-class ContactInfo(BaseModel):
-    email: Optional[str] = None
-    phone: Optional[str] = None
+class ContactInfo(LLMOutputModel):
+    email: Optional[str] = Field(None, description="Email address if mentioned, otherwise null.")
+    phone: Optional[str] = Field(None, description="Phone number if mentioned, otherwise null.")
     social_media: SocialMedia = Field(default_factory=SocialMedia)
 
-class CompanyInfo(BaseModel):
-    industry: str
-    company_size: Optional[str] = None
-    location: Optional[str] = None
-    core_products_services: List[str]
-    unique_selling_proposition: str
-    target_audience: str
+class CompanyInfo(LLMOutputModel):
+    industry: str = Field(..., description="Primary industry (e.g., 'SaaS', 'E-commerce', 'FinTech').")
+    company_size: Optional[str] = Field(
+        None, description="Employee count or size (e.g., '1-10 employees', 'Large Enterprise') if mentioned, otherwise null."
+    )
+    location: Optional[str] = Field(None, description="Headquarters or primary location if mentioned, otherwise null.")
+    core_products_services: List[str] = Field(..., description="The main products or services offered.")
+    unique_selling_proposition: str = Field(..., description="What makes the company stand out, in one sentence.")
+    target_audience: str = Field(
+        ..., description="Primary customer demographic (e.g., 'B2B SaaS companies', 'Individual Consumers')."
+    )
     contact_info: ContactInfo = Field(default_factory=ContactInfo)
 
 # Model for extracted answers within analysis
 class ExtractedAnswer(BaseModel):
-    question: str
-    answer: str
+    question: str = Field(..., description="The original question.")
+    answer: str = Field(..., description="Concise answer based on the website content, otherwise 'Not available'.")
 
 # Response model for the /analyze endpoint
 class AnalysisResponse(BaseModel):
@@ -39,16 +62,78 @@ class Message(BaseModel):
 class ConversationHistory(RootModel[List[Message]]):
     pass
 
+# 'high' skips the fast model tier and answers with the strong model (GEMINI_MODEL_NAME)
+Quality = Literal["standard", "high"]
+
 class ChatRequest(BaseModel):
     url: HttpUrl
     query: str
     conversation_history: List[Message] = []
+    quality: Quality = "standard"
 
 class ChatResponse(BaseModel):
     agent_response: str
     context_sources: List[str]
 
+# The JSON object the model returns for /chat; "sources" are passage numbers
+class ChatModelOutput(LLMOutputModel):
+    agent_response: str = Field(..., description="Concise answer to the user's query.")
+    # Strings are tolerated since models sometimes quote the numbers
+    sources: List[Union[int, str]] = Field(
+        default_factory=list,
+        description="Numbers of the passages that directly support the answer (empty if none do)."
+    )
+
 # Added for the /analyze endpoint's request body
+MAX_CRAWL_DEPTH = 2
+
 class AnalysisRequest(BaseModel):
     url: HttpUrl
-    questions: List[str] = Field(default_factory=list)
\ No newline at end of file
+    questions: List[str] = Field(default_factory=list)
+    # 0 analyzes the homepage only; 1+ also crawls linked about/contact/pricing/careers pages
+    crawl_depth: int = Field(default=0, ge=0, le=MAX_CRAWL_DEPTH)
+    quality: Quality = "standard"
+
+# Request/Response models for the /analyze/batch endpoint
+MAX_BATCH_ITEMS = 100
+
+class BatchAnalysisRequest(BaseModel):
+    items: List[AnalysisRequest] = Field(..., min_length=1, max_length=MAX_BATCH_ITEMS)
+
+class BatchAnalysisItemResult(BaseModel):
+    url: HttpUrl
+    status_code: int
+    result: Optional[AnalysisResponse] = None
+    error: Optional[str] = None
+
+class BatchAnalysisResponse(BaseModel):
+    results: List[BatchAnalysisItemResult]
+    succeeded: int
+    failed: int
+
+# Response model for the asynchronous /analyze/jobs endpoints
+class AnalysisJob(BaseModel):
+    job_id: str
+    url: HttpUrl
+    status: Literal["queued", "running", "succeeded", "failed"]
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Optional[AnalysisResponse] = None
+    error: Optional[str] = None
+    error_status_code: Optional[int] = None
+
+# Request/Response models for the server-side /chat/sessions endpoints
+class ChatSessionCreateRequest(BaseModel):
+    url: HttpUrl
+
+class ChatSessionMessageRequest(BaseModel):
+    query: str
+    quality: Quality = "standard"
+
+class ChatSessionInfo(BaseModel):
+    session_id: str
+    url: HttpUrl
+    turns: int
+    has_summary: bool
+    created_at: datetime
@@ -0,0 +1,144 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import metrics
+from extractors import TEXT_CONTENT_LIMIT, StreamingTextExtractor, extract_page
+from stats import DurationStats
+
+
+def _timed_extract(
+    html: str, engine: str, limit: Optional[int], collect_links: bool
+) -> Tuple[Tuple[str, List[str]], float, float]:
+    """Runs in the pool worker; returns the text and links plus wall-clock start/end for queue vs parse timing."""
+    started = time.time()
+    result = extract_page(html, engine, limit, collect_links)
+    return result, started, time.time()
+
+
+def _timed_feed(extractor: StreamingTextExtractor, chunk: Optional[str]) -> Tuple[None, float, float]:
+    """Feeds one chunk to an incremental extractor (None finishes the document)."""
+    started = time.time()
+    if chunk is None:
+        extractor.finish()
+    else:
+        extractor.feed(chunk)
+    return None, started, time.time()
+
+
+class _ExecutorStats:
+    def __init__(self):
+        self.queue_time = DurationStats()
+        self.parse_time = DurationStats()
+
+    def as_dict(self) -> dict:
+        return {"queue_time": self.queue_time.as_dict(), "parse_time": self.parse_time.as_dict()}
+
+
+class ParsePool:
+    """
+    Runs HTML parse-and-extract off the event loop.
+
+    Small documents go to a thread pool (cheap hand-off); documents at or above
+    process_threshold go to a process pool so that parsing a multi-megabyte page
+    neither blocks the loop nor holds the GIL. Executors are created on first use.
+    Document size is bounded by the scraper's download cap (SCRAPER_MAX_BYTES).
+    """
+
+    def __init__(
+        self,
+        engine: str = "stream",
+        thread_workers: int = 4,
+        process_workers: int = 2,
+        process_threshold: int = 512 * 1024,
+    ):
+        self.engine = engine
+        self.thread_workers = thread_workers
+        self.process_workers = process_workers
+        self.process_threshold = process_threshold
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._stats = {"thread": _ExecutorStats(), "process": _ExecutorStats()}
+
+    @classmethod
+    def from_settings(cls, settings) -> "ParsePool":
+        return cls(
+            engine=settings.HTML_EXTRACTOR,
+            thread_workers=settings.PARSE_THREAD_WORKERS,
+            process_workers=settings.PARSE_PROCESS_WORKERS,
+            process_threshold=settings.PARSE_PROCESS_THRESHOLD_BYTES,
+        )
+
+    def uses_process_pool(self, size: int) -> bool:
+        """Whether a document of `size` characters is parsed in the process pool."""
+        return self.process_workers > 0 and size >= self.process_threshold
+
+    def _executor_for(self, size: int) -> Tuple[str, Executor]:
+        if self.uses_process_pool(size):
+            if self._processes is None:
+                # 'spawn' avoids forking a process that is running an event loop and threads
+                self._processes = ProcessPoolExecutor(
+                    max_workers=self.process_workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return "process", self._processes
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(max_workers=self.thread_workers, thread_name_prefix="html-parse")
+        return "thread", self._threads
+
+    async def extract(
+        self,
+        html: str,
+        limit: Optional[int] = TEXT_CONTENT_LIMIT,
+        collect_links: bool = False,
+        engine: Optional[str] = None,
+    ) -> Tuple[str, List[str]]:
+        """
+        Extracts prompt text (and, with collect_links=True, the raw hrefs) from a
+        complete document in the pool that fits its size, with the configured
+        engine unless another one is given.
+        """
+        kind, executor = self._executor_for(len(html))
+        loop = asyncio.get_running_loop()
+        submitted = time.time()
+        result, started, finished = await loop.run_in_executor(
+            executor, _timed_extract, html, engine or self.engine, limit, collect_links
+        )
+        stats = self._stats[kind]
+        stats.queue_time.observe(max(started - submitted, 0.0))
+        stats.parse_time.observe(finished - started)
+        metrics.HTML_PARSE.observe(finished - started)
+        return result
+
+    async def feed(self, extractor: StreamingTextExtractor, chunk: Optional[str]) -> float:
+        """
+        Feeds a downloaded chunk to a stateful extractor on the thread pool.
+        Chunks are bounded by the network read size, so the thread pool is always
+        the right fit; pass None after the last chunk to flush the document.
+        Returns the seconds spent parsing the chunk.
+        """
+        _, executor = self._executor_for(0)
+        loop = asyncio.get_running_loop()
+        submitted = time.time()
+        _, started, finished = await loop.run_in_executor(executor, _timed_feed, extractor, chunk)
+        stats = self._stats["thread"]
+        stats.queue_time.observe(max(started - submitted, 0.0))
+        stats.parse_time.observe(finished - started)
+        return finished - started
+
+    def stats(self) -> dict:
+        return {
+            "engine": self.engine,
+            "process_threshold": self.process_threshold,
+            "thread": self._stats["thread"].as_dict(),
+            "process": self._stats["process"].as_dict(),
+        }
+
+    def shutdown(self) -> None:
+        if self._threads is not None:
+            self._threads.shutdown(wait=False, cancel_futures=True)
+            self._threads = None
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+            self._processes = None
@@ -0,0 +1,431 @@
+import hashlib
+import hmac
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from fastapi import HTTPException, Request, status
+from limits import RateLimitItemPerSecond
+from limits.storage import Storage
+from limits.strategies import FixedWindowRateLimiter
+from slowapi import Limiter
+
+from config import settings
+
+# The client a request is billed to; read when the LLM reports token usage
+current_client: ContextVar[Optional[str]] = ContextVar("current_client", default=None)
+
+
+def client_key(request: Request) -> str:
+    """
+    Rate limit key for a request: the API key when a valid one is sent (hashed,
+    so the secret never reaches the limit storage), otherwise the client IP.
+    Invalid keys share the IP's bucket, so guessing keys is throttled too.
+    Behind RATE_LIMIT_TRUSTED_PROXIES proxies the IP is taken from
+    X-Forwarded-For, counting that many hops from the right so clients
+    cannot spoof it.
+    """
+    api_key = request.headers.get("authorization")
+    # Compared as bytes: compare_digest rejects non-ASCII str, and headers are decoded as latin-1
+    if api_key and hmac.compare_digest(api_key.encode("utf-8"), f"Bearer {settings.API_SECRET_KEY}".encode("utf-8")):
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:24]
+
+    hops = settings.RATE_LIMIT_TRUSTED_PROXIES
+    forwarded_for = request.headers.get("x-forwarded-for")
+    if hops and forwarded_for:
+        addresses = [a.strip() for a in forwarded_for.split(",") if a.strip()]
+        if addresses:
+            return "ip:" + addresses[-min(hops, len(addresses))]
+    return "ip:" + (request.client.host if request.client else "unknown")
+
+
+# --- SHARED STORAGE ---
+
+@dataclass
+class _Window:
+    shared: int                # count across all workers as of the last sync
+    pending: int               # hits taken locally since the last sync
+    expires_at: float
+    expiry: Optional[float]    # window length for a new shared row; None for keys only read so far
+    synced: bool = False       # whether shared has been read back from the file for this window
+
+
+def _limit_of(key: str) -> Optional[int]:
+    """The limit amount in a `limits` key (namespace/identifiers.../amount/multiples/granularity)."""
+    try:
+        return int(key.rsplit("/", 3)[1])
+    except (IndexError, ValueError):
+        return None
+
+
+class SQLiteStorage(Storage):
+    """
+    Fixed-window rate limit storage in a SQLite file shared by all workers.
+
+    Registered with the `limits` library for the sqlite:// scheme, e.g.
+    sqlite:///ratelimit.sqlite3?sync_interval=0.25 (three slashes for a
+    relative path, four for an absolute one). The file is opened on first use,
+    not when the limiter is created at import. Each worker counts hits in
+    memory, and a background thread adds them to the shared rows every
+    sync_interval seconds, reading back the global counts in the same
+    statements. So that `workers` processes cannot together overshoot a limit
+    between syncs, a worker admits at most its share (limit // workers) of
+    hits without syncing, and once the known count is within a share per
+    other worker of the limit it adds each hit to the shared row before
+    answering (counting the other workers' shares as used during the first
+    two sync intervals of a window, before their hits can have been synced).
+    Hits already over the limit are rejected without a sync.
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+    # How long a key that was only read keeps being refreshed while no shared row exists for it
+    READ_RETENTION_SECONDS = 600
+
+    def __init__(self, uri: Optional[str] = None, wrap_exceptions: bool = False, **options):
+        parts = urlsplit(uri or "sqlite:///ratelimit.sqlite3")
+        query = dict(parse_qsl(parts.query))
+        self.path = parts.path[1:] or "ratelimit.sqlite3"
+        self.sync_interval = max(float(options.get("sync_interval", query.get("sync_interval", 0.25))), 0.01)
+        self.workers = max(int(options.get("workers", query.get("workers", 1))), 1)
+        # _lock guards the in-memory windows (taken on the request path); _db_lock the connection
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._windows: Dict[str, _Window] = {}
+        self._flusher: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self.syncs = 0
+        self.sync_errors = 0
+        self.local_hits = 0
+        self.inline_syncs = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connection(self) -> sqlite3.Connection:
+        """Opens (and if needed creates) the shared file on first use (called with _db_lock held)."""
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limits ("
+                "key TEXT PRIMARY KEY, count INTEGER NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def _start_flusher(self) -> None:
+        """Starts the sync thread on first use (called with _lock held)."""
+        if self._flusher is None and not self._stopped.is_set():
+            self._flusher = threading.Thread(target=self._run_flusher, name="ratelimit-sync", daemon=True)
+            self._flusher.start()
+
+    def _run_flusher(self) -> None:
+        while not self._stopped.wait(self.sync_interval):
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                self.sync_errors += 1
+                print(f"DEBUG: Rate limit sync failed: {e}")
+
+    def _sync(self, key: str, expiry: float, amount: int, now: float) -> Tuple[int, float]:
+        """Adds amount to the shared row (starting a new window if it expired) and reads it back."""
+        return self._connection().execute(
+            "INSERT INTO rate_limits (key, count, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET "
+            "count = CASE WHEN expires_at <= ? THEN excluded.count ELSE count + excluded.count END, "
+            "expires_at = CASE WHEN expires_at <= ? THEN excluded.expires_at ELSE expires_at END "
+            "RETURNING count, expires_at",
+            (key, amount, now + expiry, now, now),
+        ).fetchone()
+
+    def _read(self, keys: List[str], now: float) -> Dict[str, Tuple[int, float]]:
+        """Current shared counts of the keys whose windows have not expired."""
+        rows = {}
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows.update(
+                (key, (count, expires_at)) for key, count, expires_at in self._connection().execute(
+                    f"SELECT key, count, expires_at FROM rate_limits WHERE key IN ({placeholders}) AND expires_at > ?",
+                    (*chunk, now),
+                )
+            )
+        return rows
+
+    def _decides_locally(self, window: _Window, limit: int, amount: int) -> bool:
+        """Whether this worker's own counts are enough to answer a hit (called with _lock held)."""
+        if window.shared + window.pending + amount > limit:
+            return True   # over the limit whatever the other workers did
+        share = limit // self.workers
+        if window.pending + amount > share:
+            return False
+        # The other workers may each hold up to a share of hits this worker has not seen yet
+        return not window.synced or window.shared + window.pending + amount + (self.workers - 1) * share <= limit
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        now = time.time()
+        limit = _limit_of(key)
+        with self._lock:
+            self._start_flusher()
+            window = self._windows.get(key)
+            if window is None or window.expires_at <= now:
+                # Until the next sync this worker only knows its own hits in the window
+                window = _Window(shared=0, pending=0, expires_at=now + expiry, expiry=expiry)
+                self._windows[key] = window
+            window.expiry = expiry
+            if limit is None or self._decides_locally(window, limit, amount):
+                window.pending += amount
+                self.local_hits += 1
+                return window.shared + window.pending
+            # Share used up or close to the limit: decide on the shared count
+            pending = window.pending
+            window.shared += pending
+            window.pending = 0
+        return self._incr_shared(key, window, limit, expiry, amount, pending, now)
+
+    def _incr_shared(
+        self, key: str, window: _Window, limit: int, expiry: int, amount: int, pending: int, now: float
+    ) -> int:
+        """
+        Syncs the window's buffered hits, then adds the new hit to the shared row.
+        Early in a window the other workers may still hold their share of hits
+        unsynced, so that much is kept free for them; a hit refused only for
+        that reason is not counted, as it may fit once their hits are synced.
+        """
+        try:
+            with self._db_lock:
+                self.inline_syncs += 1
+                count, expires_at = self._sync(key, expiry, pending, now)
+                reserved = 0
+                if now < expires_at - expiry + 2 * self.sync_interval:
+                    reserved = (self.workers - 1) * (limit // self.workers)
+                held_back = count + amount <= limit < count + amount + reserved
+                if not held_back:
+                    count, expires_at = self._sync(key, expiry, amount, now)
+        except sqlite3.Error as e:
+            self.sync_errors += 1
+            print(f"DEBUG: Rate limit sync failed: {e}")
+            with self._lock:
+                # Leave the hits to the next background sync and answer from this worker's count
+                window.shared -= pending
+                window.pending += pending + amount
+                return window.shared + window.pending
+        with self._lock:
+            window.shared, window.expires_at, window.synced = count, expires_at, True
+            if held_back:
+                return window.shared + window.pending + amount + reserved
+            return window.shared + window.pending
+
+    def charge(self, key: str, expiry: int, amount: int) -> None:
+        """Counts usage that already happened (e.g. LLM tokens): buffered for the next sync, never refused."""
+        now = time.time()
+        with self._lock:
+            self._start_flusher()
+            window = self._windows.get(key)
+            if window is None or window.expires_at <= now:
+                window = _Window(shared=0, pending=0, expires_at=now + expiry, expiry=expiry)
+                self._windows[key] = window
+            window.expiry = expiry
+            window.pending += amount
+
+    def get(self, key: str) -> int:
+        now = time.time()
+        with self._lock:
+            self._start_flusher()
+            window = self._windows.get(key)
+            if window is None:
+                # Not used by this worker yet (e.g. tokens charged elsewhere): the syncs read it in
+                self._windows[key] = _Window(
+                    shared=0, pending=0, expires_at=now + self.READ_RETENTION_SECONDS, expiry=None
+                )
+                return 0
+            return window.shared + window.pending if window.expires_at > now else 0
+
+    def get_expiry(self, key: str) -> float:
+        with self._lock:
+            window = self._windows.get(key)
+            return window.expires_at if window is not None else time.time()
+
+    def flush(self) -> None:
+        """
+        Adds the locally buffered hits to the shared file and refreshes the
+        global counts of every live window. Runs on the sync thread (and once
+        on close); only the in-memory bookkeeping takes the request-path lock.
+        """
+        now = time.time()
+        hits, reads = [], []
+        with self._lock:
+            for key, window in list(self._windows.items()):
+                if window.expires_at <= now:
+                    # Hits buffered for a window that has since expired belong to no one
+                    del self._windows[key]
+                elif window.pending:
+                    hits.append((key, window.pending, window.expiry))
+                    window.shared += window.pending
+                    window.pending = 0
+                else:
+                    reads.append(key)
+        if not hits and not reads:
+            return
+
+        with self._db_lock:
+            rows = {key: self._sync(key, expiry, amount, now) for key, amount, expiry in hits}
+            rows.update(self._read(reads, now))
+            self.syncs += 1
+
+        with self._lock:
+            for key, row in rows.items():
+                window = self._windows.get(key)
+                if window is not None:
+                    window.shared, window.expires_at = row
+                    window.synced = True
+
+    def close(self) -> None:
+        """Stops the sync thread, writes the last buffered hits and closes the file (called on shutdown)."""
+        self._stopped.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def check(self) -> bool:
+        try:
+            with self._db_lock:
+                self._connection().execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> Optional[int]:
+        with self._lock:
+            self._windows.clear()
+        with self._db_lock:
+            return self._connection().execute("DELETE FROM rate_limits").rowcount
+
+    def clear(self, key: str) -> None:
+        with self._lock:
+            self._windows.pop(key, None)
+        with self._db_lock:
+            self._connection().execute("DELETE FROM rate_limits WHERE key = ?", (key,))
+
+    def stats(self) -> dict:
+        return {
+            "syncs": self.syncs,
+            "sync_errors": self.sync_errors,
+            "local_hits": self.local_hits,
+            "inline_syncs": self.inline_syncs,
+            "keys": len(self._windows),
+            "sync_interval": self.sync_interval,
+            "workers": self.workers,
+        }
+
+
+def create_limiter(settings) -> Limiter:
+    """slowapi limiter keyed on the API key, with storage shared by all workers."""
+    storage_options = {}
+    if settings.RATE_LIMIT_STORAGE_URI.startswith("sqlite:"):
+        storage_options["workers"] = settings.RATE_LIMIT_WORKERS
+    return Limiter(
+        key_func=client_key,
+        default_limits=[settings.RATE_LIMIT_DEFAULT],
+        storage_uri=settings.RATE_LIMIT_STORAGE_URI,
+        storage_options=storage_options,
+        strategy="fixed-window",
+    )
+
+
+# --- LLM TOKEN QUOTA ---
+
+class TokenQuota:
+    """
+    Per-client budget of LLM tokens per window, kept in the rate limit storage.
+
+    Requests are refused up front once the client's window is used up; the
+    tokens a call actually consumed (from Gemini's usage metadata) are
+    charged afterwards to the client in current_client. A call that starts
+    under budget may finish over it, so the quota is enforced from the next
+    request on.
+    """
+
+    def __init__(self, storage: Storage, tokens: int, window_seconds: int):
+        self.enabled = tokens > 0
+        self.item = RateLimitItemPerSecond(max(tokens, 1), max(window_seconds, 1))
+        self._storage = storage
+        self._strategy = FixedWindowRateLimiter(storage)
+        self.recorded_tokens = 0
+        self.unattributed_tokens = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_settings(cls, settings, limiter: Limiter) -> "TokenQuota":
+        return cls(limiter.limiter.storage, settings.LLM_TOKEN_QUOTA, settings.LLM_TOKEN_QUOTA_WINDOW_SECONDS)
+
+    def remaining(self, client: str) -> Tuple[int, float]:
+        reset_at, remaining = self._strategy.get_window_stats(self.item, "llm-tokens", client)
+        return remaining, reset_at
+
+    def check(self, client: str) -> None:
+        if not self.enabled:
+            return
+        remaining, reset_at = self.remaining(client)
+        if remaining <= 0:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="LLM token quota exceeded",
+                headers={"Retry-After": str(max(int(reset_at - time.time()), 1))},
+            )
+
+    def record(self, tokens: int) -> None:
+        """Charges tokens to the client of the current request or job."""
+        client = current_client.get()
+        if client is None:
+            self.unattributed_tokens += tokens
+            return
+        self.recorded_tokens += tokens
+        if not self.enabled or tokens <= 0:
+            return
+        if isinstance(self._storage, SQLiteStorage):
+            self._storage.charge(self.item.key_for("llm-tokens", client), self.item.get_expiry(), tokens)
+        else:
+            self._strategy.hit(self.item, "llm-tokens", client, cost=tokens)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "limit": str(self.item) if self.enabled else None,
+            "recorded_tokens": self.recorded_tokens,
+            "unattributed_tokens": self.unattributed_tokens,
+            "rejected": self.rejected,
+        }
+
+
+limiter = create_limiter(settings)
+token_quota = TokenQuota.from_settings(settings, limiter)
+
+
+def close_storage() -> None:
+    """Writes the SQLite storage's buffered hits and stops its sync thread (on shutdown)."""
+    storage = limiter.limiter.storage
+    if isinstance(storage, SQLiteStorage):
+        storage.close()
+
+
+def limiter_stats() -> dict:
+    storage = limiter.limiter.storage
+    return {
+        "storage": type(storage).__name__,
+        **(storage.stats() if isinstance(storage, SQLiteStorage) else {}),
+        "token_quota": token_quota.stats(),
+    }
@@ -0,0 +1,152 @@
+import hashlib
+import math
+import re
+from collections import Counter, OrderedDict
+from typing import Dict, List, Tuple
+
+from cache import normalize_url
+from sessions import estimate_tokens
+
+CHUNK_CHARS = 400   # Target passage size (~100 tokens); adjacent short blocks are merged up to it
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "do", "does", "for", "from", "has", "have", "how",
+    "in", "is", "it", "its", "of", "on", "or", "our", "that", "the", "their", "they", "this", "to",
+    "was", "we", "what", "when", "where", "which", "who", "why", "with", "you", "your",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def chunk_text(text: str, chunk_chars: int = CHUNK_CHARS) -> List[str]:
+    """
+    Splits extracted page text (one block per line) into passages of about
+    chunk_chars characters, merging short headings and paragraphs with their
+    neighbours and splitting long lines on word boundaries.
+    """
+    chunks: List[str] = []
+    current = ""
+    for line in text.split("\n"):
+        line = line.strip()
+        while len(line) > chunk_chars:
+            cut = line.rfind(" ", 0, chunk_chars)
+            cut = cut if cut > chunk_chars // 2 else chunk_chars
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:cut].strip())
+            line = line[cut:].strip()
+        if not line:
+            continue
+        if current and len(current) + len(line) + 1 > chunk_chars:
+            chunks.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class BM25Index:
+    """
+    Okapi BM25 over the token arrays of a list of passages.
+
+    Built once per page text and queried per chat turn; everything is plain
+    dicts and counters, so building an index for a 20 KB page takes well
+    under a millisecond and needs no extra dependencies.
+    """
+
+    def __init__(self, passages: List[str], k1: float = 1.5, b: float = 0.75):
+        self.passages = passages
+        self.k1 = k1
+        self.b = b
+        self._term_freqs = [Counter(tokenize(p)) for p in passages]
+        self._lengths = [sum(tf.values()) for tf in self._term_freqs]
+        self._avg_length = (sum(self._lengths) / len(passages)) if passages else 0.0
+        document_frequency: Dict[str, int] = Counter()
+        for tf in self._term_freqs:
+            document_frequency.update(tf.keys())
+        n = len(passages)
+        self._idf = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in document_frequency.items()
+        }
+
+    def scores(self, query: str) -> List[float]:
+        terms = set(tokenize(query))
+        scores = []
+        for tf, length in zip(self._term_freqs, self._lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / (self._avg_length or 1))
+            scores.append(sum(
+                self._idf[t] * tf[t] * (self.k1 + 1) / (tf[t] + norm) for t in terms if t in tf
+            ))
+        return scores
+
+    def select(self, query: str, token_budget: int, top_k: int) -> List[str]:
+        """
+        Returns up to top_k of the best-scoring passages that fit the token
+        budget, in document order. When nothing matches the query (e.g. a
+        greeting) the opening passages of the page are used instead.
+        """
+        scores = self.scores(query)
+        ranked = sorted((i for i in range(len(self.passages)) if scores[i] > 0), key=lambda i: (-scores[i], i))
+        if not ranked:
+            ranked = list(range(len(self.passages)))
+
+        selected: List[int] = []
+        used = 0
+        for i in ranked:
+            cost = estimate_tokens(self.passages[i])
+            if used + cost > token_budget:
+                continue
+            selected.append(i)
+            used += cost
+            if len(selected) >= top_k:
+                break
+        return [self.passages[i] for i in sorted(selected)]
+
+
+class RetrievalIndexCache:
+    """
+    LRU of BM25 indexes keyed by normalized URL.
+
+    Each entry remembers a hash of the text it was built from, so a page whose
+    scraped text changed (cache refresh, revalidation) is re-indexed on use.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[str, BM25Index]]" = OrderedDict()
+        self.hits = 0
+        self.builds = 0
+
+    @classmethod
+    def from_settings(cls, settings) -> "RetrievalIndexCache":
+        return cls(max_entries=settings.RETRIEVAL_INDEX_MAX_ENTRIES)
+
+    def get(self, url: str, text_content: str) -> BM25Index:
+        key = normalize_url(url)
+        content_hash = hashlib.sha256(text_content.encode("utf-8")).hexdigest()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == content_hash:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        index = BM25Index(chunk_text(text_content))
+        self.builds += 1
+        self._entries[key] = (content_hash, index)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return index
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "builds": self.builds,
+        }
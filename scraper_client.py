@@ -0,0 +1,314 @@
+import asyncio
+import codecs
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+import httpcore
+import httpx
+
+import metrics
+
+try:
+    import h2  # noqa: F401  (httpx only needs it to be importable for HTTP/2)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (compatible; WebsiteIntelligenceAgent/1.0)",
+    "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.8",
+}
+
+HTML_CONTENT_TYPES = {"text/html", "application/xhtml+xml"}
+# Served without a useful type; the first bytes decide whether the body is HTML
+SNIFFED_CONTENT_TYPES = {"", "application/octet-stream", "binary/octet-stream"}
+SNIFF_BYTES = 1024
+
+
+class UnsupportedContentError(Exception):
+    """Raised when a response is not HTML, detected before the body is downloaded."""
+
+
+def _looks_like_html(head: bytes) -> bool:
+    sample = head[:SNIFF_BYTES]
+    if b"\x00" in sample:
+        return False
+    sample = sample.lstrip(codecs.BOM_UTF8).lstrip().lower()
+    return sample.startswith(b"<") or b"<html" in sample or b"<!doctype html" in sample
+
+
+class _PoolStats:
+    """Counters describing how requests were served by the connection pool."""
+
+    def __init__(self):
+        self.requests = 0
+        self.hits = 0        # served on an already-open (warm) connection
+        self.misses = 0      # required a new TCP/TLS connection
+        self.waits = 0       # had to queue for a pool or per-host slot
+        self.bytes_downloaded = 0
+        self.truncated = 0           # bodies cut off at the byte cap
+        self.stopped_early = 0       # downloads abandoned once enough text was extracted
+        self.rejected_content = 0    # non-HTML responses rejected before reading the body
+
+    def as_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "hits": self.hits,
+            "misses": self.misses,
+            "waits": self.waits,
+            "bytes_downloaded": self.bytes_downloaded,
+            "truncated": self.truncated,
+            "stopped_early": self.stopped_early,
+            "rejected_content": self.rejected_content,
+        }
+
+
+class _TrackedStream(httpx.AsyncByteStream):
+    """Response body stream that reports when it is closed (the connection is released)."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._on_close is not None:
+                self._on_close()
+                self._on_close = None
+
+
+class _StatsTransport(httpx.AsyncHTTPTransport):
+    """
+    AsyncHTTPTransport that classifies each request as a pool hit, miss or wait.
+
+    A request is a miss when httpcore's trace extension reports a new TCP
+    connection for it. It waits when the pool has to queue it: no open
+    connection can take it (an HTTP/2 connection takes several requests at
+    once), the pool is full and no idle connection can be closed to make room.
+    """
+
+    def __init__(self, stats: _PoolStats, max_connections: int, **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+        self._max_connections = max_connections
+        self.active_requests = 0     # responses not yet closed
+        self.connections_opened = 0
+
+    def _release(self) -> None:
+        self.active_requests -= 1
+
+    def _open_connections(self) -> list:
+        return [
+            connection for connection in self._pool.connections
+            if not connection.is_closed() and not connection.has_expired()
+        ]
+
+    def _must_wait(self, request: httpx.Request) -> bool:
+        """Whether the pool will queue `request` (mirrors httpcore's assignment rules)."""
+        origin = httpcore.URL(
+            scheme=request.url.raw_scheme, host=request.url.raw_host, port=request.url.port, target="/"
+        ).origin
+        connections = self._open_connections()
+        if any(connection.can_handle_request(origin) and connection.is_available() for connection in connections):
+            return False
+        if len(connections) < self._max_connections:
+            return False
+        return not any(connection.is_idle() for connection in connections)
+
+    def connection_counts(self) -> Dict[str, int]:
+        """Open connections in the pool and how many of them are idle."""
+        connections = self._open_connections()
+        return {
+            "open": len(connections),
+            "idle": sum(1 for connection in connections if connection.is_idle()),
+        }
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        connected = False
+        upstream_trace = request.extensions.get("trace")
+
+        async def trace(event_name: str, info: dict) -> None:
+            nonlocal connected
+            if event_name == "connection.connect_tcp.complete":
+                connected = True
+            if upstream_trace is not None:
+                await upstream_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        self._stats.requests += 1
+        if self._must_wait(request):
+            self._stats.waits += 1
+        self.active_requests += 1
+        try:
+            response = await super().handle_async_request(request)
+        except BaseException:
+            self._release()
+            raise
+        if connected:
+            self._stats.misses += 1
+            self.connections_opened += 1
+        else:
+            self._stats.hits += 1
+        response.stream = _TrackedStream(response.stream, self._release)
+        return response
+
+
+class _HostSlot:
+    def __init__(self, limit: int):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.users = 0   # requests holding or waiting for the semaphore
+
+
+class ScraperClient:
+    """
+    Application-lifetime HTTP client used for scraping.
+
+    Wraps a single pooled httpx.AsyncClient so that repeat scrapes of the same
+    origin reuse warm keep-alive connections instead of paying a new TCP/TLS
+    handshake per request. Concurrency per host is capped separately from the
+    global pool size so one slow site cannot hog every connection.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        max_connections_per_host: int = 6,
+        http2: bool = True,
+        timeout: float = 10.0,
+        max_bytes: int = 5 * 1024 * 1024,
+    ):
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.max_bytes = max_bytes
+        self.max_connections_per_host = max_connections_per_host
+        self._stats = _PoolStats()
+        # Only hosts with requests in flight or waiting have an entry
+        self._host_slots: Dict[str, _HostSlot] = {}
+        self._transport = _StatsTransport(
+            self._stats,
+            max_connections=max_connections,
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+        )
+        self._client = httpx.AsyncClient(
+            transport=self._transport,
+            follow_redirects=True,
+            timeout=timeout,
+            headers=DEFAULT_HEADERS,
+        )
+
+    @classmethod
+    def from_settings(cls, settings) -> "ScraperClient":
+        return cls(
+            max_connections=settings.SCRAPER_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.SCRAPER_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.SCRAPER_KEEPALIVE_EXPIRY_SECONDS,
+            max_connections_per_host=settings.SCRAPER_MAX_CONNECTIONS_PER_HOST,
+            http2=settings.SCRAPER_HTTP2,
+            timeout=settings.SCRAPER_TIMEOUT_SECONDS,
+            max_bytes=settings.SCRAPER_MAX_BYTES,
+        )
+
+    @asynccontextmanager
+    async def _host_slot(self, url: str) -> AsyncIterator[None]:
+        """Holds one of the host's max_connections_per_host slots."""
+        host = httpx.URL(url).host
+        slot = self._host_slots.get(host)
+        if slot is None:
+            slot = self._host_slots[host] = _HostSlot(self.max_connections_per_host)
+        if slot.semaphore.locked():
+            self._stats.waits += 1
+        slot.users += 1
+        try:
+            async with slot.semaphore:
+                yield
+        finally:
+            slot.users -= 1
+            if not slot.users:
+                del self._host_slots[host]
+
+    async def get(self, url: str, headers: Optional[dict] = None) -> httpx.Response:
+        """Performs a GET through the shared pool, respecting the per-host limit."""
+        async with self._host_slot(url):
+            return await self._client.get(url, headers=headers)
+
+    @asynccontextmanager
+    async def stream(self, url: str, headers: Optional[dict] = None) -> AsyncIterator[httpx.Response]:
+        """Opens a streamed GET through the shared pool; the body is read with iter_html()."""
+        async with self._host_slot(url):
+            async with self._client.stream("GET", url, headers=headers) as response:
+                yield response
+
+    async def iter_html(self, response: httpx.Response) -> AsyncIterator[str]:
+        """
+        Yields the decoded body of a streamed response in chunks.
+
+        Non-HTML responses are rejected from the Content-Type header, or by
+        sniffing the first bytes when the type is missing, before the rest of
+        the body is read. Reading stops at max_bytes; callers may also stop
+        iterating early once they have extracted enough text.
+        """
+        content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+        if content_type not in HTML_CONTENT_TYPES and content_type not in SNIFFED_CONTENT_TYPES:
+            self._stats.rejected_content += 1
+            raise UnsupportedContentError(f"Unsupported content type: {content_type}")
+
+        decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+        received = 0
+        sniffed = content_type in HTML_CONTENT_TYPES
+        try:
+            async for chunk in response.aiter_bytes():
+                if not sniffed:
+                    if not _looks_like_html(chunk):
+                        self._stats.rejected_content += 1
+                        raise UnsupportedContentError("Response body does not look like HTML")
+                    sniffed = True
+                remaining = self.max_bytes - received
+                if len(chunk) >= remaining:
+                    chunk = chunk[:remaining]
+                    self._stats.truncated += 1
+                received += len(chunk)
+                self._stats.bytes_downloaded += len(chunk)
+                metrics.SCRAPED_BYTES.inc(len(chunk))
+                yield decoder.decode(chunk)
+                if received >= self.max_bytes:
+                    break
+            yield decoder.decode(b"", final=True)
+        except GeneratorExit:
+            # The caller stopped reading: the rest of the body is never downloaded
+            self._stats.stopped_early += 1
+            raise
+
+    def stats(self) -> dict:
+        """Returns pool counters plus the pool's current connections and requests."""
+        connections = self._transport.connection_counts()
+        return {
+            **self._stats.as_dict(),
+            "connections_open": connections["open"],
+            "connections_idle": connections["idle"],
+            "active_requests": self._transport.active_requests,
+            "connections_opened": self._transport.connections_opened,
+            "hosts_in_flight": len(self._host_slots),
+            "http2": self.http2,
+        }
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def __aenter__(self) -> "ScraperClient":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
@@ -1,21 +1,70 @@
+import asyncio
 import httpx
-import google.generativeai as genai
 import json
-from bs4 import BeautifulSoup
+import time
 from fastapi import HTTPException
-from typing import Optional, List
+from pydantic import BaseModel
+from functools import lru_cache
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, Optional, List, Tuple, Type, TypeVar
+from urllib.parse import urljoin
+from cache import AnalysisCache, ScrapeCache, ScrapedPage, normalize_url
 from config import settings
+from crawler import CrawledPage, RobotsCache, discover_links, rank_passages
+from extractors import TEXT_CONTENT_LIMIT, StreamingTextExtractor
+from json_stream import StringFieldStreamer
+from llm_client import LLMClient, LLMTimeoutError
+from llm_json import LLMOutputError, parse_model, schema_for_prompt
+from llm_router import ModelRouter
+from parse_pool import ParsePool
+from retrieval import RetrievalIndexCache
+from scraper_client import ScraperClient, UnsupportedContentError
+from sessions import ChatSession, SessionStore
+from singleflight import SingleFlight
+from upstream import UpstreamOverloadedError, is_overload_error
+import metrics
 import models
 # from .models import CompanyInfo # <-- THIS LINE HAS BEEN REMOVED
 
-# Configure the Gemini API
-genai.configure(api_key=settings.GEMINI_API_KEY)
+# The Gemini SDK is imported and configured by LLMClient.load(), in the app's readiness step
+
+# Extracted page text keyed by normalized URL (shared across requests)
+scrape_cache = ScrapeCache.from_settings(settings)
+# Validated analyses keyed by model, prompt version, content hash and questions
+analysis_cache = AnalysisCache.from_settings(settings)
+
+# HTML parsing runs in thread/process pools so large pages never block the event loop
+parse_pool = ParsePool.from_settings(settings)
+
+# Parsed robots.txt per origin, consulted before crawling beyond the homepage
+robots_cache = RobotsCache.from_settings(settings)
+
+# BM25 passage indexes over scraped page text, used to build /chat prompts
+retrieval_indexes = RetrievalIndexCache.from_settings(settings)
+
+# Concurrent identical scrapes (per scrape cache key) and analyses (per URL and
+# analysis cache key) share one in-flight execution instead of repeating it
+scrape_flights = SingleFlight()
+analysis_flights = SingleFlight()
+
+# Unusable LLM replies: fixed by one targeted re-ask, or failed for good
+_PARSE_REASKED = metrics.llm_output_parses.labels("reasked")
+_PARSE_FAILED = metrics.llm_output_parses.labels("failed")
+
+M = TypeVar("M", bound=BaseModel)
+
+# Strong references to fire-and-forget tasks so they are not garbage collected mid-run
+_background_tasks = set()
 
 # --- PROMPT ENGINEERING ---
 # This section contains the carefully crafted prompts for the LLM.
 
+# Bump whenever ANALYSIS_PROMPT_TEMPLATE changes so cached analyses are not reused
+ANALYSIS_PROMPT_VERSION = "2"
+
 ANALYSIS_PROMPT_TEMPLATE = """
 Analyze the text content from the homepage of the website: {url}.
+When the text is split by [Page: ...] markers it also includes other pages of the same site.
 Based *only* on the text provided below, extract the following business information.
 Your response MUST be a valid JSON object matching the specified structure. Do not include any text or markdown formatting before or after the JSON.
 
@@ -53,19 +102,36 @@ Your response MUST be a valid JSON object matching the specified structure. Do n
 """
 
 
+# With LLM_STRUCTURED_OUTPUT the JSON structure comes from the response schema
+# (see the field descriptions in models.py), so the prompt only carries the task and data
+ANALYSIS_PROMPT_TEMPLATE_STRUCTURED = """
+Analyze the text content from the homepage of the website: {url}.
+When the text is split by [Page: ...] markers it also includes other pages of the same site.
+Based *only* on the text provided below, extract the business information in the response schema.
+Answer each question in extracted_answers; if there are none, provide default insights.
+
+**Website Text Content:**
+{text_content}
+
+**Questions to Answer:**
+{questions_json}
+"""
+
+
 CONVERSATIONAL_PROMPT_TEMPLATE = """
-You are an AI assistant tasked with answering questions about a website, using ONLY the provided text content and conversation history.
-Do not invent information. If the information is not present in the text, state that.
+You are an AI assistant tasked with answering questions about a website, using ONLY the provided website passages and conversation history.
+Do not invent information. If the information is not present in the passages, state that.
 Your response MUST be a valid JSON object matching the specified structure. Do not include any text or markdown formatting before or after the JSON.
 
 **JSON Output Structure:**
 {{
   "agent_response": "Your concise answer to the user's query.",
-  "context_sources": ["List brief phrases or sections from the website text that directly support your answer."]
+  "sources": [1, 3]
 }}
+"sources" lists the numbers of the passages that directly support your answer (empty if none do).
 
-**Website Text Content:**
-{text_content}
+**Website Passages:**
+{passages}
 
 **Conversation History:**
 {formatted_history}
@@ -75,121 +141,760 @@ Your response MUST be a valid JSON object matching the specified structure. Do n
 """
 
 
-async def scrape_website_text(url: str) -> Optional[str]:
-    """Scrapes the text content from a given URL's homepage."""
+REPAIR_PROMPT_TEMPLATE = """
+Your previous response could not be used because: {problem}
+Rewrite it as a single valid JSON object that matches the JSON schema below, keeping its content.
+Your response MUST contain only the JSON object. Do not include any text or markdown formatting before or after the JSON.
+
+**JSON Schema:**
+{schema}
+
+**Previous Response:**
+{previous}
+"""
+
+
+CONVERSATIONAL_PROMPT_TEMPLATE_STRUCTURED = """
+Answer the user's query about a website using ONLY the passages and conversation history below.
+Do not invent information. If the information is not present in the passages, state that.
+
+**Website Passages:**
+{passages}
+
+**Conversation History:**
+{formatted_history}
+
+**User's Current Query:**
+{query}
+"""
+
+# Models whose Gemini response schemas are built at startup in structured-output mode
+STRUCTURED_OUTPUT_MODELS = (models.AnalysisResponse, models.ChatModelOutput)
+
+
+SUMMARY_PROMPT_TEMPLATE = """
+Summarize the following conversation between a user and an AI assistant about a website.
+Merge it with the existing summary, keeping every fact, question and answer that later turns may refer to.
+Respond with plain text only, in at most 150 words.
+
+**Existing Summary:**
+{summary}
+
+**Conversation To Summarize:**
+{transcript}
+"""
+
+
+@asynccontextmanager
+async def _open_stream(
+    url: str,
+    scraper: Optional[ScraperClient],
+    headers: Optional[dict] = None
+) -> AsyncIterator[Tuple[ScraperClient, httpx.Response]]:
+    """Opens a streamed GET through the shared scraper pool, or a one-off client if none is given."""
+    if scraper is not None:
+        async with scraper.stream(url, headers=headers) as response:
+            yield scraper, response
+        return
+    async with ScraperClient.from_settings(settings) as one_off_client:
+        async with one_off_client.stream(url, headers=headers) as response:
+            yield one_off_client, response
+
+
+async def _extract_streamed(
+    client: ScraperClient,
+    response: httpx.Response,
+    limit: int = TEXT_CONTENT_LIMIT,
+    collect_links: bool = False
+) -> Tuple[str, List[str]]:
+    """
+    Extracts text (and optionally absolute links) while the body downloads.
+    With the streaming engine (and for link discovery) each chunk is fed to the
+    extractor as it arrives and the download stops once the text budget is full.
+    Once the bytes received reach the parse pool's process threshold, the rest
+    is read (up to the download cap) and the whole document is parsed in the
+    process pool instead; other engines always parse the document in one go.
+    If the streaming extractor fails, the document is parsed with BeautifulSoup.
+    """
+    extractor = None
+    if parse_pool.engine == "stream" or collect_links:
+        extractor = StreamingTextExtractor(limit, collect_links=collect_links)
+    engine = None
+    received: List[str] = []
+    size = 0
+    parse_seconds = 0.0
+    chunks = client.iter_html(response)
+    try:
+        async for chunk in chunks:
+            received.append(chunk)
+            size += len(chunk)
+            if extractor is None:
+                continue
+            if parse_pool.uses_process_pool(size):
+                # Too big to parse chunk by chunk here: hand the whole document off
+                extractor = None
+                continue
+            try:
+                parse_seconds += await parse_pool.feed(extractor, chunk)
+            except Exception as e:
+                print(f"DEBUG: stream extractor failed, falling back to BeautifulSoup: {e}")
+                extractor, engine = None, "bs4"
+                continue
+            if extractor.done:
+                break
+    finally:
+        await chunks.aclose()
+    if extractor is not None:
+        try:
+            parse_seconds += await parse_pool.feed(extractor, None)
+        except Exception as e:
+            print(f"DEBUG: stream extractor failed, falling back to BeautifulSoup: {e}")
+            extractor, engine = None, "bs4"
+    if extractor is not None:
+        # One observation per document, not per network chunk
+        metrics.HTML_PARSE.observe(parse_seconds)
+        text, hrefs = extractor.text, extractor.links or []
+    else:
+        html = "".join(received)
+        text, hrefs = await parse_pool.extract(html, limit, collect_links and engine is None, engine)
+    base_url = str(response.url)
+    return text, [urljoin(base_url, href) for href in hrefs]
+
+
+def _scrape_cache_key(url: str, limit: int, collect_links: bool) -> str:
+    key = normalize_url(url)
+    # The default homepage scrape keeps the bare URL as its key
+    if limit != TEXT_CONTENT_LIMIT or collect_links:
+        key = f"{key} limit={limit}{' links' if collect_links else ''}"
+    return key
+
+
+async def scrape_page(
+    url: str,
+    scraper: Optional[ScraperClient] = None,
+    use_cache: bool = True,
+    limit: int = TEXT_CONTENT_LIMIT,
+    collect_links: bool = False
+) -> ScrapedPage:
+    """
+    Scrapes one page into a ScrapedPage holding up to `limit` characters of text
+    and, with collect_links=True, the page's absolute links.
+    With use_cache=False a cached copy is only reused after the origin confirms it (304).
+    """
+    cache_key = _scrape_cache_key(url, limit, collect_links)
+    cached_page, is_fresh = await scrape_cache.lookup(cache_key, allow_fresh=use_cache)
+    if cached_page and is_fresh:
+        return cached_page
+
+    return await scrape_flights.do(
+        cache_key, lambda: _fetch_page(url, scraper, cache_key, cached_page, limit, collect_links)
+    )
+
+
+async def _fetch_page(
+    url: str,
+    scraper: Optional[ScraperClient],
+    cache_key: str,
+    cached_page: Optional[ScrapedPage],
+    limit: int,
+    collect_links: bool
+) -> ScrapedPage:
+    """Downloads (or revalidates) a page, extracts it and stores it in the scrape cache."""
+    started = time.perf_counter()
     try:
-        async with httpx.AsyncClient(follow_redirects=True) as client:
-            response = await client.get(url, timeout=10.0)
+        # Revalidate stale entries instead of re-downloading unchanged pages
+        headers = ScrapeCache.conditional_headers(cached_page) if cached_page else None
+        async with _open_stream(url, scraper, headers) as (client, response):
+            if response.status_code == 304 and cached_page:
+                await scrape_cache.mark_revalidated(cache_key, cached_page)
+                return cached_page
             response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
 
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            # Prioritize visible text content from common elements
-            paragraphs = [p.get_text(strip=True) for p in soup.find_all('p') if p.get_text(strip=True)]
-            headings = [h.get_text(strip=True) for h in soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']) if h.get_text(strip=True)]
-            
-            # Combine content, removing duplicates and ensuring readability
-            content_list = list(set(paragraphs + headings))
-            text_content = "\n".join(content_list)
-            
-            # Fallback to body text if specific elements are scarce
-            if len(text_content) < 200: # Arbitrary threshold for minimal content
-                body_text = soup.body.get_text(separator=' ', strip=True) if soup.body else ''
-                text_content = body_text
-
-            return text_content[:4000] # Limit content to avoid overly long prompts
+            text_content, links = await _extract_streamed(client, response, limit, collect_links)
+        page = ScrapedPage(
+            text=text_content,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+            links=links,
+        )
+        if text_content:
+            await scrape_cache.store(cache_key, page)
+        return page
+    except UnsupportedContentError as e:
+        print(f"DEBUG: Unsupported content for {url}: {e}")
+        raise HTTPException(status_code=422, detail=f"Website did not return an HTML page: {url}. {e}")
     except httpx.RequestError as e:
         print(f"DEBUG: HTTPX Request Error for {url}: {e}")
+        metrics.upstream_errors.labels("website", "request").inc()
         raise HTTPException(status_code=400, detail=f"Could not connect to URL: {url}. Error: {e}")
     except httpx.HTTPStatusError as e:
-        print(f"DEBUG: HTTPX Status Error for {url}: {e.response.status_code} - {e.response.text}")
+        print(f"DEBUG: HTTPX Status Error for {url}: {e.response.status_code} - {e.response.reason_phrase}")
+        metrics.upstream_errors.labels("website", "status").inc()
         raise HTTPException(status_code=e.response.status_code, detail=f"HTTP Error for {url}: {e.response.status_code}")
     except Exception as e:
         print(f"DEBUG: Unexpected error during scraping {url}: {e}")
+        metrics.upstream_errors.labels("website", "error").inc()
         raise HTTPException(status_code=500, detail=f"Failed to scrape website: {url}. Error: {e}")
-
-
-def generate_llm_response(prompt: str) -> str:
-    """Sends a prompt to the Gemini LLM and returns the text response."""
+    finally:
+        metrics.SCRAPE_FETCH.observe(time.perf_counter() - started)
+
+
+async def scrape_website_text(
+    url: str,
+    scraper: Optional[ScraperClient] = None,
+    use_cache: bool = True
+) -> Optional[str]:
+    """
+    Scrapes the text content from a given URL's homepage.
+    With use_cache=False a cached copy is only reused after the origin confirms it (304).
+    """
+    page = await scrape_page(url, scraper, use_cache)
+    return page.text
+
+
+async def crawl_website(
+    url: str,
+    crawl_depth: int,
+    scraper: Optional[ScraperClient] = None,
+    use_cache: bool = True
+) -> List[CrawledPage]:
+    """
+    Scrapes the homepage plus up to CRAWL_MAX_PAGES - 1 same-site pages
+    (about, contact, team, pricing, careers...) found within crawl_depth links.
+
+    Each level is fetched concurrently, at most CRAWL_CONCURRENCY_PER_HOST at a
+    time per origin across all crawls (one at a time with the robots.txt
+    Crawl-delay when the site sets one).
+    Pages disallowed by robots.txt are skipped, and a failing subpage never fails
+    the crawl. Only the homepage errors are raised.
+    """
+    if scraper is None:
+        async with ScraperClient.from_settings(settings) as one_off_client:
+            return await crawl_website(url, crawl_depth, one_off_client, use_cache)
+
+    homepage = await scrape_page(
+        url, scraper, use_cache, limit=settings.CRAWL_PAGE_TEXT_LIMIT, collect_links=True
+    )
+    if not homepage.text:
+        raise HTTPException(status_code=404, detail="Could not extract content from the website.")
+    pages = [CrawledPage(url=url, text=homepage.text)]
+    visited = {normalize_url(url)}
+    frontier = discover_links(url, homepage.links, settings.CRAWL_MAX_PAGES)
+
+    async def fetch(link: str) -> Optional[ScrapedPage]:
+        if not await robots_cache.allowed(link, scraper):
+            return None
+        # The origin's slots are shared with every other crawl of the site
+        async with robots_cache.slot(link, scraper):
+            try:
+                return await scrape_page(
+                    link, scraper, use_cache, limit=settings.CRAWL_PAGE_TEXT_LIMIT, collect_links=True
+                )
+            except HTTPException as e:
+                print(f"DEBUG: Skipping crawled page {link}: {e.detail}")
+                return None
+
+    for _ in range(crawl_depth):
+        batch = []
+        for link in frontier:
+            key = normalize_url(link)
+            if key not in visited and len(pages) + len(batch) < settings.CRAWL_MAX_PAGES:
+                visited.add(key)
+                batch.append(link)
+        if not batch:
+            break
+        results = await asyncio.gather(*(fetch(link) for link in batch))
+        frontier = []
+        for link, page in zip(batch, results):
+            if page is not None and page.text:
+                pages.append(CrawledPage(url=link, text=page.text))
+                frontier.extend(discover_links(link, page.links, settings.CRAWL_MAX_PAGES))
+    return pages
+
+
+async def gather_website_text(
+    url: str,
+    questions: List[str],
+    crawl_depth: int = 0,
+    scraper: Optional[ScraperClient] = None,
+    use_cache: bool = True
+) -> Optional[str]:
+    """
+    Returns the prompt text for an analysis: the homepage text, or with
+    crawl_depth > 0 the crawled chunks most relevant to the questions.
+    """
+    if not crawl_depth:
+        return await scrape_website_text(url, scraper, use_cache)
+    pages = await crawl_website(url, crawl_depth, scraper, use_cache)
+    return rank_passages(pages, questions, TEXT_CONTENT_LIMIT)
+
+
+@lru_cache(maxsize=1)
+def _default_llm_client() -> ModelRouter:
+    """Long-lived model router used when no application-scoped one is injected."""
+    return ModelRouter.from_settings(settings)
+
+
+def _response_model(model: Type[M]) -> Optional[Type[M]]:
+    """The model to constrain Gemini's reply to, when structured output is enabled."""
+    return model if settings.LLM_STRUCTURED_OUTPUT else None
+
+
+async def generate_llm_response(
+    prompt: str,
+    llm: Optional[LLMClient] = None,
+    response_model: Optional[Type[BaseModel]] = None
+) -> str:
+    """
+    Sends a prompt to the Gemini LLM and returns the text response.
+    With a response_model the reply is JSON constrained to that model's schema.
+    """
+    llm = llm or _default_llm_client().tiers()[0]
     try:
-        model = genai.GenerativeModel(settings.GEMINI_MODEL_NAME) # Using model name from config
-        response = model.generate_content(prompt)
-        # Access content directly from the response object
-        return response.text
+        return await llm.generate(prompt, response_model=response_model)
+    except LLMTimeoutError as e:
+        print(f"DEBUG: LLM API Timeout: {e}")
+        raise HTTPException(status_code=504, detail=f"AI model did not respond in time: {e}")
+    except UpstreamOverloadedError as e:
+        print(f"DEBUG: LLM call shed: {e}")
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": str(max(int(e.retry_after), 1))}
+        )
     except Exception as e:
         print(f"DEBUG: LLM API Error: {e}")
+        if is_overload_error(e):
+            # Still rate limited or failing after the governor's retries
+            raise HTTPException(status_code=503, detail=f"AI model is overloaded: {e}", headers={"Retry-After": "5"})
         raise HTTPException(status_code=500, detail=f"Failed to get response from AI model: {e}")
 
 
-async def get_website_analysis(url: str, questions: List[str]) -> dict:
-    """Orchestrates scraping and AI analysis for the /analyze endpoint."""
-    text_content = await scrape_website_text(url)
-    if not text_content:
-        raise HTTPException(status_code=404, detail="Could not extract content from the website.")
+async def parse_llm_output(llm_output: str, model: Type[M], llm: Optional[LLMClient] = None) -> M:
+    """
+    Validates LLM output into model, repairing common JSON defects locally.
+    Only output that cannot be repaired costs a re-ask, and that re-ask sends
+    just the broken reply and the schema rather than re-running the prompt.
+    """
+    try:
+        with metrics.VALIDATION.time():
+            return parse_model(llm_output, model)
+    except LLMOutputError as e:
+        print(f"DEBUG: Unusable JSON from LLM ({e}). Raw output was: '{llm_output}'")
+        problem = str(e)
+    if settings.LLM_STRUCTURED_OUTPUT:
+        # The reply was already constrained by the schema; asking again would not help
+        _PARSE_FAILED.inc()
+        raise HTTPException(status_code=500, detail="Failed to parse AI model's JSON response.")
 
-    questions_json = json.dumps([{"question": q} for q in questions]) if questions else "[]"
-    
-    prompt = ANALYSIS_PROMPT_TEMPLATE.format(
-        url=url,
-        text_content=text_content,
-        questions_json=questions_json
+    prompt = REPAIR_PROMPT_TEMPLATE.format(problem=problem, schema=schema_for_prompt(model), previous=llm_output)
+    retry_output = await generate_llm_response(prompt, llm)
+    try:
+        with metrics.VALIDATION.time():
+            parsed = parse_model(retry_output, model)
+    except LLMOutputError as e:
+        print(f"DEBUG: Re-asked JSON still unusable ({e}). Raw output was: '{retry_output}'")
+        _PARSE_FAILED.inc()
+        raise HTTPException(status_code=500, detail="Failed to parse AI model's JSON response.")
+    _PARSE_REASKED.inc()
+    return parsed
+
+
+async def generate_routed(
+    prompt: str,
+    model: Type[M],
+    llm: Optional[ModelRouter] = None,
+    high_quality: bool = False,
+    needs_escalation: Optional[Callable[[M], bool]] = None
+) -> M:
+    """
+    Generates a reply validated into model, starting on the router's fast
+    tier. A fast reply that fails validation, or that needs_escalation
+    rejects, is handed to the strong tier instead of being re-asked; the
+    strong tier's reply is final and gets parse_llm_output's usual re-ask.
+    """
+    llm = llm or _default_llm_client()
+    *cheaper_tiers, final_tier = llm.route(high_quality)
+    for tier in cheaper_tiers:
+        llm_output = await generate_llm_response(prompt, tier, _response_model(model))
+        try:
+            with metrics.VALIDATION.time():
+                parsed = parse_model(llm_output, model)
+        except LLMOutputError as e:
+            print(f"DEBUG: Unusable JSON from {tier.model_name} ({e}); escalating to {final_tier.model_name}")
+            llm.record_escalation("invalid")
+            continue
+        if needs_escalation is None or not needs_escalation(parsed):
+            return parsed
+        print(f"DEBUG: Weak answer from {tier.model_name}; escalating to {final_tier.model_name}")
+        llm.record_escalation("not_available")
+
+    llm_output = await generate_llm_response(prompt, final_tier, _response_model(model))
+    return await parse_llm_output(llm_output, model, final_tier)
+
+
+def _is_not_available(answer: str) -> bool:
+    return answer.strip().rstrip(".").lower() == "not available"
+
+
+def _mostly_not_available(analysis: models.AnalysisResponse, ratio: float) -> bool:
+    """True when more than ratio of the analysis's answers are 'Not available'."""
+    answers = analysis.extracted_answers
+    if not answers:
+        return False
+    missing = sum(1 for extracted in answers if _is_not_available(extracted.answer))
+    return missing > ratio * len(answers)
+
+
+async def analyze_text_content(
+    url: str,
+    text_content: str,
+    questions: List[str],
+    llm: Optional[ModelRouter] = None,
+    use_cache: bool = True,
+    high_quality: bool = False
+) -> models.AnalysisResponse:
+    """Runs the AI analysis over already-scraped text, using the analysis cache when allowed."""
+    llm = llm or _default_llm_client()
+    prompt_version = f"{ANALYSIS_PROMPT_VERSION}-structured" if settings.LLM_STRUCTURED_OUTPUT else ANALYSIS_PROMPT_VERSION
+    # Keyed on the models the call may use, so high-quality requests never reuse a fast-tier analysis
+    model_names = "+".join(tier.model_name for tier in llm.tiers(high_quality))
+    cache_key = AnalysisCache.make_key(model_names, prompt_version, text_content, questions)
+    if use_cache:
+        cached_analysis = await analysis_cache.get(cache_key)
+        if cached_analysis is not None:
+            return cached_analysis
+    else:
+        analysis_cache.record_bypass()
+
+    return await analysis_flights.do(
+        (normalize_url(url), cache_key),
+        lambda: _run_analysis(url, text_content, questions, llm, cache_key, high_quality)
     )
 
-    llm_output = generate_llm_response(prompt)
 
-    # Clean the LLM output by removing markdown fences and stripping whitespace
-    llm_output = llm_output.strip().removeprefix("```json").removesuffix("```")
-    llm_output = llm_output.strip()
-
-    try:
-        analysis_data = json.loads(llm_output)
-
-        # --- NEW: Clean 'null' strings from HttpUrl fields before Pydantic validation ---
-        company_info = analysis_data.get("company_info", {})
-        contact_info = company_info.get("contact_info", {})
-        social_media = contact_info.get("social_media", {})
-
-        if social_media:
-            for key in ["linkedin", "twitter"]:
-                # Ensure the value is a string and it's 'null' (case-insensitive)
-                if isinstance(social_media.get(key), str) and social_media[key].lower() == 'null':
-                    social_media[key] = None # Convert to Python None
-        # --- END NEW ---
-
-        return models.AnalysisResponse(
-            company_info=models.CompanyInfo(**company_info),
-            extracted_answers=[models.ExtractedAnswer(**qa) for qa in analysis_data.get("extracted_answers", [])]
+async def _run_analysis(
+    url: str,
+    text_content: str,
+    questions: List[str],
+    llm: ModelRouter,
+    cache_key: str,
+    high_quality: bool = False
+) -> models.AnalysisResponse:
+    """Calls the model, validates its JSON into an AnalysisResponse and caches it."""
+    with metrics.PROMPT_BUILD.time():
+        questions_json = json.dumps([{"question": q} for q in questions]) if questions else "[]"
+
+        template = ANALYSIS_PROMPT_TEMPLATE_STRUCTURED if settings.LLM_STRUCTURED_OUTPUT else ANALYSIS_PROMPT_TEMPLATE
+        prompt = template.format(
+            url=url,
+            text_content=text_content,
+            questions_json=questions_json
         )
-    except json.JSONDecodeError:
-        print(f"DEBUG: Failed to decode JSON from LLM. Raw output was: '{llm_output}'")
-        raise HTTPException(status_code=500, detail="Failed to parse AI model's JSON response.")
 
+    analysis = await generate_routed(
+        prompt, models.AnalysisResponse, llm, high_quality,
+        needs_escalation=lambda parsed: _mostly_not_available(parsed, llm.not_available_ratio)
+    )
 
-async def get_conversational_answer(url: str, query: str, history: list):
-    """Orchestrates scraping and AI conversation for the /chat endpoint."""
-    text_content = await scrape_website_text(url)
+    await analysis_cache.set(cache_key, analysis)
+    return analysis
+
+
+async def get_website_analysis(
+    url: str,
+    questions: List[str],
+    scraper: Optional[ScraperClient] = None,
+    llm: Optional[ModelRouter] = None,
+    use_cache: bool = True,
+    crawl_depth: int = 0,
+    high_quality: bool = False
+) -> models.AnalysisResponse:
+    """
+    Orchestrates scraping and AI analysis for the /analyze endpoint.
+    With use_cache=False the cached analysis is skipped (but refreshed with the new result).
+    With high_quality=True the analysis skips the fast model tier.
+    """
+    text_content = await gather_website_text(url, questions, crawl_depth, scraper, use_cache)
     if not text_content:
         raise HTTPException(status_code=404, detail="Could not extract content from the website.")
 
-    formatted_history = "\n".join([f"{item.role.capitalize()}: {item.content}" for item in history])
+    return await analyze_text_content(url, text_content, questions, llm, use_cache, high_quality)
+
+
+async def get_batch_analysis(
+    items: List[models.AnalysisRequest],
+    scraper: Optional[ScraperClient] = None,
+    llm: Optional[ModelRouter] = None,
+    use_cache: bool = True
+) -> models.BatchAnalysisResponse:
+    """
+    Orchestrates the /analyze/batch endpoint.
+
+    Each distinct URL is scraped once, with at most BATCH_SCRAPE_CONCURRENCY
+    scrapes in flight. Every item starts its LLM call as soon as its own page
+    is ready (bounded by BATCH_LLM_CONCURRENCY), so scraping and analysis
+    overlap. Failures are reported per item and never abort the batch.
+    """
+    scrape_slots = asyncio.Semaphore(settings.BATCH_SCRAPE_CONCURRENCY)
+    llm_slots = asyncio.Semaphore(settings.BATCH_LLM_CONCURRENCY)
+
+    async def scrape(url: str, crawl_depth: int):
+        async with scrape_slots:
+            if crawl_depth:
+                return await crawl_website(url, crawl_depth, scraper, use_cache)
+            return await scrape_website_text(url, scraper, use_cache)
+
+    # Dedupe URLs: items for the same page (and crawl depth) await one shared scrape task
+    scrape_tasks: Dict[Tuple[str, int], asyncio.Task] = {}
+    for item in items:
+        key = (normalize_url(str(item.url)), item.crawl_depth)
+        if key not in scrape_tasks:
+            scrape_tasks[key] = asyncio.ensure_future(scrape(str(item.url), item.crawl_depth))
+
+    async def analyze(item: models.AnalysisRequest) -> models.BatchAnalysisItemResult:
+        url = str(item.url)
+        try:
+            scraped = await scrape_tasks[(normalize_url(url), item.crawl_depth)]
+            # Crawled pages are ranked per item, since relevance depends on its questions
+            text_content = rank_passages(scraped, item.questions, TEXT_CONTENT_LIMIT) if item.crawl_depth else scraped
+            if not text_content:
+                raise HTTPException(status_code=404, detail="Could not extract content from the website.")
+            async with llm_slots:
+                analysis = await analyze_text_content(
+                    url, text_content, item.questions, llm, use_cache, item.quality == "high"
+                )
+            return models.BatchAnalysisItemResult(url=item.url, status_code=200, result=analysis)
+        except HTTPException as e:
+            return models.BatchAnalysisItemResult(url=item.url, status_code=e.status_code, error=str(e.detail))
+        except Exception as e:
+            print(f"DEBUG: Unexpected error analyzing {url} in batch: {e}")
+            return models.BatchAnalysisItemResult(url=item.url, status_code=500, error=str(e))
+
+    results = await asyncio.gather(*(analyze(item) for item in items))
+    succeeded = sum(1 for r in results if r.error is None)
+    return models.BatchAnalysisResponse(
+        results=results,
+        succeeded=succeeded,
+        failed=len(results) - succeeded
+    )
+
+
+async def scrape_chat_text(url: str, scraper: Optional[ScraperClient] = None) -> str:
+    """Scrapes a page for /chat, keeping up to CHAT_SCRAPE_TEXT_LIMIT characters for retrieval."""
+    page = await scrape_page(url, scraper, limit=settings.CHAT_SCRAPE_TEXT_LIMIT)
+    if not page.text:
+        raise HTTPException(status_code=404, detail="Could not extract content from the website.")
+    return page.text
+
+
+def retrieve_passages(url: str, text_content: str, query: str, history: list) -> List[str]:
+    """
+    Picks the passages of the page most relevant to the query, within the
+    CHAT_CONTEXT_TOKEN_BUDGET. The previous user message is added to the query
+    so short follow-ups ("and their pricing?") keep their topic.
+    """
+    previous_query = next((m.content for m in reversed(history) if m.role == "user"), "")
+    index = retrieval_indexes.get(url, text_content)
+    return index.select(
+        f"{query} {previous_query}", settings.CHAT_CONTEXT_TOKEN_BUDGET, settings.CHAT_TOP_K_PASSAGES
+    )
 
-    prompt = CONVERSATIONAL_PROMPT_TEMPLATE.format(
-        text_content=text_content,
+
+def render_conversational_prompt(passages: List[str], formatted_history: str, query: str) -> str:
+    template = CONVERSATIONAL_PROMPT_TEMPLATE_STRUCTURED if settings.LLM_STRUCTURED_OUTPUT else CONVERSATIONAL_PROMPT_TEMPLATE
+    return template.format(
+        passages="\n".join(f"[{i}] {passage}" for i, passage in enumerate(passages, start=1)),
         formatted_history=formatted_history,
         query=query
     )
 
-    llm_output = generate_llm_response(prompt)
-
-    # --- Clean the LLM output by removing markdown fences ---
-    llm_output = llm_output.strip().removeprefix("```json").removesuffix("```")
-    llm_output = llm_output.strip() # Strip any remaining whitespace
-    # ---------------------------------------------------------------------------------
 
+async def build_conversational_prompt(
+    url: str,
+    query: str,
+    history: list,
+    scraper: Optional[ScraperClient] = None
+) -> Tuple[str, List[str]]:
+    """
+    Scrapes the website and renders the /chat prompt for the given query and
+    history. Returns the prompt and the passages it carries.
+    """
+    text_content = await scrape_chat_text(url, scraper)
+    with metrics.PROMPT_BUILD.time():
+        passages = retrieve_passages(url, text_content, query, history)
+
+        formatted_history = "\n".join([f"{item.role.capitalize()}: {item.content}" for item in history])
+
+        return render_conversational_prompt(passages, formatted_history, query), passages
+
+
+async def get_conversational_answer(
+    url: str,
+    query: str,
+    history: list,
+    scraper: Optional[ScraperClient] = None,
+    llm: Optional[ModelRouter] = None,
+    high_quality: bool = False
+):
+    """Orchestrates scraping and AI conversation for the /chat endpoint."""
+    prompt, passages = await build_conversational_prompt(url, query, history, scraper)
+
+    return await _answer_chat(prompt, passages, llm, high_quality)
+
+
+def _cited_passages(sources: list, passages: List[str]) -> List[str]:
+    """Maps the passage numbers the model cited back to the passage text."""
+    cited = []
+    for source in sources:
+        try:
+            number = int(source)
+        except (TypeError, ValueError):
+            continue
+        if 1 <= number <= len(passages) and passages[number - 1] not in cited:
+            cited.append(passages[number - 1])
+    return cited
+
+
+async def _answer_chat(
+    prompt: str,
+    passages: List[str],
+    llm: Optional[ModelRouter] = None,
+    high_quality: bool = False
+) -> dict:
+    """
+    Generates and decodes the /chat JSON object; context_sources are the
+    retrieved passages the model cited.
+    """
+    chat_output = await generate_routed(prompt, models.ChatModelOutput, llm, high_quality)
+    return {
+        "agent_response": chat_output.agent_response,
+        "sources": chat_output.sources,
+        "context_sources": _cited_passages(chat_output.sources, passages),
+    }
+
+
+# --- CHAT SESSIONS ---
+
+async def create_chat_session(url: str, store: SessionStore, scraper: Optional[ScraperClient] = None) -> ChatSession:
+    """Scrapes the website once and pins its text to a new server-side chat session."""
+    text_content = await scrape_chat_text(url, scraper)
+    return store.create(url, text_content)
+
+
+async def get_session_answer(
+    session: ChatSession,
+    query: str,
+    store: SessionStore,
+    llm: Optional[ModelRouter] = None,
+    high_quality: bool = False
+) -> dict:
+    """
+    Answers one turn of a server-side chat session using the passages of the
+    pinned page text relevant to the query, the running summary and the recent
+    turns, then records the turn.
+    """
+    async with session.lock:
+        with metrics.PROMPT_BUILD.time():
+            passages = retrieve_passages(session.url, session.text_content, query, session.turns)
+            prompt = render_conversational_prompt(passages, session.formatted_history(), query)
+        chat_data = await _answer_chat(prompt, passages, llm, high_quality)
+        session.turns.append(models.Message(role="user", content=query))
+        session.turns.append(models.Message(role="agent", content=str(chat_data.get("agent_response", ""))))
+
+    if session.history_tokens() > settings.SESSION_HISTORY_TOKEN_BUDGET:
+        # Compact off the request path; the next turn waits on the session lock if needed
+        task = asyncio.create_task(compact_session_history(session, store, llm))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+    return chat_data
+
+
+async def compact_session_history(session: ChatSession, store: SessionStore, llm: Optional[ModelRouter] = None):
+    """Folds all but the most recent turns into the session's running summary."""
+    async with session.lock:
+        if session.history_tokens() <= settings.SESSION_HISTORY_TOKEN_BUDGET:
+            return
+        keep = settings.SESSION_KEEP_RECENT_MESSAGES
+        split = max(len(session.turns) - keep, 0)
+        older, recent = session.turns[:split], session.turns[split:]
+        if not older:
+            return
+        prompt = SUMMARY_PROMPT_TEMPLATE.format(
+            summary=session.summary or "(none)",
+            transcript="\n".join(f"{m.role.capitalize()}: {m.content}" for m in older)
+        )
+        try:
+            # Summaries are routine work: always the cheapest tier
+            summary = await generate_llm_response(prompt, (llm or _default_llm_client()).tiers()[0])
+        except HTTPException:
+            # Keep the full history; compaction is retried after the next turn
+            return
+        session.summary = summary.strip()
+        session.turns = recent
+        store.compactions += 1
+
+
+def _sse_event(event: str, data: dict) -> str:
+    """Formats one Server-Sent Event with a single-line JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_conversational_answer(
+    prompt: str,
+    passages: List[str],
+    llm: Optional[ModelRouter] = None,
+    high_quality: bool = False
+) -> AsyncIterator[str]:
+    """
+    Streams a /chat answer as Server-Sent Events.
+
+    'token' events carry the agent_response text as soon as Gemini produces it,
+    decoded incrementally from the partial JSON. A final 'result' event carries
+    the complete ChatResponse, or an 'error' event (with the status code the
+    non-streaming endpoint would return) if generation fails.
+    Streams never escalate, since the answer may already have reached the
+    client: they use the fast tier unless high_quality is set.
+    """
+    llm = llm or _default_llm_client()
+    tier = llm.route(high_quality)[0]
+    streamer = StringFieldStreamer("agent_response")
     try:
-        chat_data = json.loads(llm_output)
-        return chat_data
-    except json.JSONDecodeError:
-        # It's helpful to print the problematic output for debugging if it still fails
-        print(f"DEBUG: Failed to decode JSON. Raw output was: '{llm_output}'")
-        raise HTTPException(status_code=500, detail="Failed to parse AI model's JSON response.")
+        async for chunk in tier.stream(prompt, response_model=_response_model(models.ChatModelOutput)):
+            delta = streamer.feed(chunk)
+            if delta:
+                yield _sse_event("token", {"delta": delta})
+    except LLMTimeoutError as e:
+        print(f"DEBUG: LLM API Timeout: {e}")
+        yield _sse_event("error", {"status_code": 504, "detail": f"AI model did not respond in time: {e}"})
+        return
+    except UpstreamOverloadedError as e:
+        print(f"DEBUG: LLM call shed: {e}")
+        yield _sse_event("error", {"status_code": 503, "detail": str(e), "retry_after": max(int(e.retry_after), 1)})
+        return
+    except Exception as e:
+        print(f"DEBUG: LLM API Error: {e}")
+        if is_overload_error(e):
+            # Same 503 and retry hint as the non-streaming endpoints
+            yield _sse_event("error", {"status_code": 503, "detail": f"AI model is overloaded: {e}", "retry_after": 5})
+            return
+        yield _sse_event("error", {"status_code": 500, "detail": f"Failed to get response from AI model: {e}"})
+        return
+
+    llm_output = streamer.buffer
+    try:
+        with metrics.VALIDATION.time():
+            chat_output = parse_model(llm_output, models.ChatModelOutput)
+        chat_response = models.ChatResponse(
+            agent_response=chat_output.agent_response,
+            context_sources=_cited_passages(chat_output.sources, passages)
+        )
+    except LLMOutputError as e:
+        # No re-ask here: the answer text may already have reached the client
+        if not streamer.value:
+            _PARSE_FAILED.inc()
+            print(f"DEBUG: Unusable JSON from LLM ({e}). Raw output was: '{llm_output}'")
+            yield _sse_event("error", {"status_code": 500, "detail": "Failed to parse AI model's JSON response."})
+            return
+        # The answer text already reached the client; keep it even if the trailing JSON is malformed
+        chat_response = models.ChatResponse(agent_response=streamer.value, context_sources=[])
+
+    yield _sse_event("result", chat_response.model_dump())
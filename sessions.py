@@ -0,0 +1,111 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import models
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) used for history budgeting."""
+    return len(text) // 4 + 1
+
+
+@dataclass
+class ChatSession:
+    session_id: str
+    url: str
+    text_content: str
+    summary: str = ""
+    turns: List[models.Message] = field(default_factory=list)
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    last_active: float = field(default_factory=time.monotonic)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
+
+    def history_tokens(self) -> int:
+        return estimate_tokens(self.summary) + sum(estimate_tokens(m.content) for m in self.turns)
+
+    def formatted_history(self) -> str:
+        lines = []
+        if self.summary:
+            lines.append(f"Summary of earlier conversation: {self.summary}")
+        lines.extend(f"{m.role.capitalize()}: {m.content}" for m in self.turns)
+        return "\n".join(lines)
+
+    def info(self) -> models.ChatSessionInfo:
+        return models.ChatSessionInfo(
+            session_id=self.session_id,
+            url=self.url,
+            turns=len(self.turns),
+            has_summary=bool(self.summary),
+            created_at=self.created_at,
+        )
+
+
+class SessionStore:
+    """
+    Bounded in-process store of chat sessions.
+
+    Sessions idle for longer than idle_ttl are evicted on access, and the least
+    recently used session is dropped once max_sessions is exceeded. Sessions
+    live in the worker that created them, so multi-worker deployments need
+    sticky routing on the session id.
+    """
+
+    def __init__(self, max_sessions: int = 1000, idle_ttl: float = 1800.0):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self.created = 0
+        self.evicted = 0
+        self.compactions = 0
+
+    @classmethod
+    def from_settings(cls, settings) -> "SessionStore":
+        return cls(
+            max_sessions=settings.SESSION_MAX_SESSIONS,
+            idle_ttl=settings.SESSION_IDLE_TTL_SECONDS,
+        )
+
+    def _evict_idle(self) -> None:
+        now = time.monotonic()
+        # The OrderedDict is kept in last-active order, so idle sessions are at the front
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_active <= self.idle_ttl:
+                break
+            self._sessions.popitem(last=False)
+            self.evicted += 1
+
+    def create(self, url: str, text_content: str) -> ChatSession:
+        self._evict_idle()
+        session = ChatSession(session_id=uuid.uuid4().hex, url=url, text_content=text_content)
+        self._sessions[session.session_id] = session
+        self.created += 1
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evicted += 1
+        return session
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        self._evict_idle()
+        session = self._sessions.get(session_id)
+        if session is not None:
+            session.last_active = time.monotonic()
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+    def stats(self) -> dict:
+        return {
+            "active_sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "created": self.created,
+            "evicted": self.evicted,
+            "compactions": self.compactions,
+        }
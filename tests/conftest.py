@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Make the application modules importable when run from anywhere
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
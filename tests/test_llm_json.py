@@ -0,0 +1,77 @@
+import json
+from typing import List, Optional
+
+import pytest
+from pydantic import BaseModel
+
+from llm_json import LLMOutputError, extract_json_object, parse_model, repair_json
+
+
+class Company(BaseModel):
+    name: str
+    employees: Optional[int] = None
+    sources: List[int] = []
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"name": "Acme"}', '{"name": "Acme"}'),
+    ('```json\n{"name": "Acme"}\n```', '{"name": "Acme"}'),
+    ('Here is the JSON you asked for:\n{"name": "Acme"}\nLet me know!', '{"name": "Acme"}'),
+    ('Use {curly} braces {"name": "Acme"}', '{"name": "Acme"}'),
+    ('{"name": "a } in a string", "sources": [1]}', '{"name": "a } in a string", "sources": [1]}'),
+    ('{"name": "\\"quoted\\" }"}', '{"name": "\\"quoted\\" }"}'),
+    ('```json\n{"name": "Acme",\n```', '{"name": "Acme",'),
+    ('no object here', None),
+])
+def test_extract_json_object(text, expected):
+    assert extract_json_object(text) == expected
+
+
+@pytest.mark.parametrize("candidate, expected", [
+    # Trailing commas
+    ('{"name": "Acme",}', {"name": "Acme"}),
+    ('{"sources": [1, 2, ],}', {"sources": [1, 2]}),
+    # Raw control characters inside strings
+    ('{"name": "line\nbreak\tand tab"}', {"name": "line\nbreak\tand tab"}),
+    # Escapes are kept as they are
+    ('{"name": "say \\"hi\\" \\u00e9",}', {"name": 'say "hi" é'}),
+    # Truncation: containers are closed and cut-off parts are dropped
+    ('{"name": "Acme', {"name": "Acme"}),
+    ('{"name": "Acme\\', {"name": "Acme"}),
+    ('{"name": "Acme", "empl', {"name": "Acme"}),
+    ('{"name": "Acme", "employees"', {"name": "Acme"}),
+    ('{"name": "Acme", "employees":', {"name": "Acme"}),
+    ('{"name": "Acme", "employees": 12', {"name": "Acme"}),
+    ('{"name": "Acme", "employees": 12 ', {"name": "Acme", "employees": 12}),
+    ('{"name": "Acme", "employees": 1.5e', {"name": "Acme"}),
+    ('{"name": "Acme", "public": tru', {"name": "Acme"}),
+    ('{"name": "Acme", "public": true', {"name": "Acme", "public": True}),
+    ('{"name": "Acme", "ceo": nul', {"name": "Acme"}),
+    ('{"name": "Acme", "sources": [1, -', {"name": "Acme", "sources": [1]}),
+    ('{"name": "Acme", "sources": [1, 2,', {"name": "Acme", "sources": [1, 2]}),
+    ('{"name": "Acme", "people": [{"role": "CEO"}, {"ro', {"name": "Acme", "people": [{"role": "CEO"}]}),
+    ('{"name": "Acme", "office": {"city": "Oslo", "zip": -', {"name": "Acme", "office": {"city": "Oslo"}}),
+])
+def test_repair_json(candidate, expected):
+    assert json.loads(repair_json(candidate)) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"name": "Acme", "employees": 40}', Company(name="Acme", employees=40)),
+    ('Sure!\n```json\n{"name": "Acme", "sources": [1, 2,],}\n```', Company(name="Acme", sources=[1, 2])),
+    ('{"name": "Acme", "sources": [3, 4', Company(name="Acme", sources=[3])),
+    ('{"name": "Acme", "employees": 4', Company(name="Acme")),
+])
+def test_parse_model(text, expected):
+    assert parse_model(text, Company) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "I could not find that information.",
+    '{"employees": 40}',
+    '{"name": "Acme", "employees": "many"}',
+])
+def test_parse_model_errors(text):
+    with pytest.raises(LLMOutputError) as info:
+        parse_model(text, Company)
+    assert info.value.raw == text
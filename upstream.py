@@ -0,0 +1,268 @@
+import asyncio
+import random
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class UpstreamOverloadedError(Exception):
+    """Raised when a call is shed because the upstream cannot take it right now."""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(UpstreamOverloadedError):
+    """Raised without calling the upstream while the circuit breaker is open."""
+
+
+def is_overload_error(exc: BaseException) -> bool:
+    """True for upstream errors that signal overload or a transient outage (429, 5xx, timeouts)."""
+    if isinstance(exc, asyncio.TimeoutError):
+        return True
+    # Looked up rather than imported (it pulls in grpc): until the Gemini SDK has been
+    # imported, no exception can be one of its types
+    google_exceptions = sys.modules.get("google.api_core.exceptions")
+    if google_exceptions is None:
+        return False
+    return (
+        isinstance(exc, (google_exceptions.TooManyRequests, google_exceptions.ServerError))
+        and not isinstance(exc, google_exceptions.MethodNotImplemented)
+    )
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """Reads a server-requested delay from a Retry-After header or a RetryInfo error detail."""
+    response = getattr(exc, "response", None)
+    header = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+    if header:
+        try:
+            return max(float(header), 0.0)
+        except ValueError:
+            pass    # HTTP-date form; fall back to our own backoff
+    for detail in getattr(exc, "details", None) or ():
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None:
+            return delay.seconds + delay.nanos / 1e9
+    return None
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after failure_threshold consecutive overload failures.
+    While open every call fails fast; after reset_timeout one probe call is
+    let through (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._probe_in_flight = False
+
+    def before_call(self) -> None:
+        if self.state == "closed":
+            return
+        remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+        if self.state == "open" and remaining <= 0:
+            self.state = "half_open"
+        if self.state == "open" or self._probe_in_flight:
+            self.rejected += 1
+            raise CircuitOpenError("AI model is temporarily unavailable", retry_after=max(remaining, 1.0))
+        self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.times_opened += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def abandon(self) -> None:
+        """The call ended without a verdict (cancelled); let another probe through."""
+        self._probe_in_flight = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+class UpstreamGovernor:
+    """
+    Admission control for calls to a rate-limited upstream (Gemini).
+
+    Concurrency follows AIMD: every success raises the limit by 1/limit (about
+    one slot per round of calls), every overload signal halves it, at most
+    once per round (signals from calls started before the last decrease are
+    ignored). Calls wait for a slot until the admission deadline and are shed
+    with UpstreamOverloadedError after it. call() retries overload errors
+    with full-jitter exponential backoff, or the server's Retry-After when
+    given, and a circuit breaker stops calls entirely during an outage.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 32,
+        min_concurrency: int = 1,
+        admission_timeout: float = 10.0,
+        max_retries: int = 3,
+        retry_base: float = 0.5,
+        retry_max: float = 8.0,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min(min_concurrency, max_concurrency)
+        self.admission_timeout = admission_timeout
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.breaker = breaker or CircuitBreaker()
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self._slot_freed = asyncio.Condition()
+        self._last_decrease = 0.0
+        self.admitted = 0
+        self.shed = 0
+        self.retries = 0
+        self.overloads = 0
+
+    @classmethod
+    def from_settings(cls, settings) -> "UpstreamGovernor":
+        return cls(
+            max_concurrency=settings.LLM_MAX_CONCURRENCY,
+            min_concurrency=settings.LLM_MIN_CONCURRENCY,
+            admission_timeout=settings.LLM_ADMISSION_TIMEOUT_SECONDS,
+            max_retries=settings.LLM_MAX_RETRIES,
+            retry_base=settings.LLM_RETRY_BASE_SECONDS,
+            retry_max=settings.LLM_RETRY_MAX_SECONDS,
+            breaker=CircuitBreaker(
+                failure_threshold=settings.LLM_BREAKER_FAILURE_THRESHOLD,
+                reset_timeout=settings.LLM_BREAKER_RESET_SECONDS,
+            ),
+        )
+
+    async def _acquire(self, timeout: float) -> None:
+        async with self._slot_freed:
+            if self.in_flight >= int(self.limit):
+                self.waiting += 1
+                try:
+                    await asyncio.wait_for(
+                        self._slot_freed.wait_for(lambda: self.in_flight < int(self.limit)),
+                        timeout=max(timeout, 0.0),
+                    )
+                except asyncio.TimeoutError:
+                    self.shed += 1
+                    raise UpstreamOverloadedError("AI model is at capacity; try again shortly")
+                finally:
+                    self.waiting -= 1
+            self.in_flight += 1
+            self.admitted += 1
+
+    async def _release(self) -> None:
+        async with self._slot_freed:
+            self.in_flight -= 1
+            self._slot_freed.notify_all()
+
+    def _on_success(self) -> None:
+        self.breaker.record_success()
+        self.limit = min(self.limit + 1 / self.limit, float(self.max_concurrency))
+
+    def _on_overload(self, started_at: float) -> None:
+        self.overloads += 1
+        self.breaker.record_failure()
+        if started_at >= self._last_decrease:
+            self.limit = max(self.limit / 2, float(self.min_concurrency))
+            self._last_decrease = time.monotonic()
+
+    @asynccontextmanager
+    async def admit(self, deadline: Optional[float] = None) -> AsyncIterator[None]:
+        """
+        Holds one upstream slot for the body of the block and feeds its outcome
+        back into the concurrency limit and the circuit breaker. Raises
+        UpstreamOverloadedError when no slot frees up before the deadline.
+        """
+        self.breaker.before_call()
+        deadline = deadline or time.monotonic() + self.admission_timeout
+        try:
+            await self._acquire(deadline - time.monotonic())
+        except BaseException:
+            self.breaker.abandon()
+            raise
+        started_at = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            if is_overload_error(e):
+                self._on_overload(started_at)
+            else:
+                # The upstream answered (e.g. a 400), so it is reachable
+                self.breaker.record_success()
+            raise
+        except BaseException:
+            self.breaker.abandon()
+            raise
+        else:
+            self._on_success()
+        finally:
+            await self._release()
+
+    def backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.retry_base)
+        return random.uniform(0, min(self.retry_max, self.retry_base * 2 ** attempt))
+
+    async def call(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """Runs fn under admit(), retrying overload errors with backoff."""
+        deadline = time.monotonic() + self.admission_timeout
+        attempt = 0
+        while True:
+            try:
+                async with self.admit(deadline):
+                    return await fn()
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                if not is_overload_error(e) or isinstance(e, asyncio.TimeoutError) or attempt >= self.max_retries:
+                    raise
+                delay = self.backoff(attempt, retry_after_seconds(e))
+                if delay > self.retry_max:
+                    # The server asked us to wait longer than a client should be kept waiting
+                    raise UpstreamOverloadedError("AI model is rate limited; try again later", retry_after=delay) from e
+                attempt += 1
+                self.retries += 1
+                await asyncio.sleep(delay)
+                # Each retry gets a fresh admission window
+                deadline = time.monotonic() + self.admission_timeout
+
+    def stats(self) -> dict:
+        return {
+            "concurrency_limit": round(self.limit, 2),
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "retries": self.retries,
+            "overloads": self.overloads,
+            "breaker": self.breaker.stats(),
+        }